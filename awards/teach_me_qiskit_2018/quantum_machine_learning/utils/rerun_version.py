@@ -25,84 +25,1265 @@ updating the 'requirements.txt' file adjusting the "QISKit" dependency.
 
 Usage:
 
-$ python3 utils/rerun_version.py
+$ python3 utils/rerun_version.py [--execute] [--jobs N] [--timeout SECONDS]
 
-The script will search for all the *.ipynb
+The output of the version cell only depends on the environment: the
+installed distributions, the Python version and 'requirements.txt'. So by
+default, "version.ipynb" is executed once, and its output is copied into the
+version cell of every other notebook without starting a kernel. A fingerprint
+of the environment is saved in the metadata of each notebook, and notebooks
+whose fingerprint matches the current one are left alone. If nothing has
+changed, no kernel is started at all.
+
+With `--execute`, the script will search for all the *.ipynb files under the
+current directory and run their version cells. The notebooks are run in the
+order of the dependency graph of their `%run` cells, so "version.ipynb" comes
+before the notebooks that run it. Each notebook that other notebooks
+`%run` is then run once more per directory, and the variables it defines
+are pickled, so that the `%run` cells of the dependents restore them and
+get its outputs instead of running it again. The notebooks that do not
+depend on each other can be run several at a time with `--jobs`, by that
+many worker processes. Progress is reported in the order of the notebooks,
+followed by a summary of the notebooks that failed.
+
+Each worker starts a kernel once, imports qiskit in it, and reuses it for all
+the notebooks it runs, resetting it in between. Use `--no-warm` to start a
+new kernel for every notebook instead.
+
+With `--profile REPORT`, every cell of every notebook is run instead, one
+notebook at a time and without saving them. The wall time, peak memory of
+the kernel and number of simulator jobs submitted are recorded for each cell
+and written to REPORT as JSON, along with the versions of the qiskit
+packages. `--trace TRACE` also writes the timings as a Chrome trace (for
+chrome://tracing or Perfetto), and `--compare OLD_REPORT` lists the cells
+that got slower since an earlier report:
+
+$ python3 utils/rerun_version.py --profile after.json --trace after.trace.json --compare before.json
+
+With `--cache DIR`, every cell of every notebook is run and the notebooks are
+saved, but the outputs of each cell are cached in DIR, keyed by its source
+chained with the sources of all the cells before it and the environment
+fingerprint. When a notebook is run again, the outputs of the cells before
+the first changed cell are reused, and only the cells from there onward are
+run. To give them the same state, the variables of the kernel are
+snapshotted after each cell that is run, and the snapshot of the last
+reused cell is restored first. If that cell's variables could not all be
+pickled, the whole notebook is run again. `--jobs` and `--no-warm` apply as
+with `--execute`:
+
+$ python3 utils/rerun_version.py --cache ~/.cache/notebook_cells --jobs 4
 
 """
 
+import argparse
+import copy
+import functools
 import glob
+import hashlib
+import json
+import multiprocessing
+import multiprocessing.connection
 import os
+import re
+import shutil
+import signal
+import sys
+import tempfile
+import time
 import warnings
 
+try:
+    from importlib import metadata
+except ImportError:
+    import importlib_metadata as metadata
+
 import nbformat
-from nbconvert.preprocessors import ExecutePreprocessor
+from jupyter_client import KernelManager
+from nbconvert.preprocessors import CellExecutionError, ExecutePreprocessor
+
+try:
+    from nbclient.util import ensure_async, run_sync
+except ImportError:
+    # Older versions of nbconvert run kernels with blocking clients only.
+    ensure_async = run_sync = None
 
 
 NOTEBOOK_FILENAMES = [a for a in sorted(glob.glob('**/*.ipynb',
                                                   recursive=True))]
 # NOTEBOOK_FILENAMES = '1_introduction/compiling_and_running.ipynb'
 
+# The requirements file displayed by the version cell, next to the notebooks.
+REQUIREMENTS = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'requirements.txt')
+
+# Code run once when a warm kernel starts. The modules it imports stay loaded.
+WARMUP_CODE = 'import qiskit'
+
+# Code run in a warm kernel before each notebook: it clears the namespace,
+# unloads the modules imported since warming up and changes the directory.
+RESET_CODE = """%%reset -f
+import os as _os, sys as _sys
+[_sys.modules.pop(_name) for _name in list(_sys.modules)
+ if _name not in _sys._warm_modules]
+_os.chdir(%r)
+del _os, _sys
+"""
+
+
+def kernel_pid(km):
+    """Return the process id of the kernel started by a kernel manager."""
+    # Since jupyter_client 7, the process is held by the kernel provisioner.
+    provisioner = getattr(km, 'provisioner', None)
+    if provisioner is not None:
+        return provisioner.process.pid
+    return km.kernel.pid
+
+
+def is_version_cell(cell):
+    """Return whether a cell is one that runs "../version.ipynb"."""
+    return cell.cell_type == 'code' and cell.source.startswith(
+        ('%run "../version.ipynb"', "%run '../version.ipynb'",
+         '%run ../version.ipynb'))
+
+
+# A line that runs a notebook, with its filename in one of the groups.
+RUN_LINE = re.compile(r'%run\s+(?:"([^"]+\.ipynb)"|'
+                      r"'([^']+\.ipynb)'|(\S+\.ipynb))$")
+
+
+def run_targets(cell, path):
+    """Return the notebooks run by a cell made only of `%run` lines.
+
+    Args:
+        cell (NotebookNode): notebook cell.
+        path (str): directory the notebook is run in.
+
+    Returns:
+        list[str]: filenames of the notebooks, relative to the current
+            directory, or an empty list if the cell is anything else.
+    """
+    if cell.cell_type != 'code':
+        return []
+    targets = []
+    for line in cell.source.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        match = RUN_LINE.match(line)
+        if match is None:
+            return []
+        target = [group for group in match.groups() if group][0]
+        targets.append(os.path.relpath(os.path.join(path, target)))
+    return targets
+
+
+class SnapshotRunPreprocessor(ExecutePreprocessor):
+    """ExecutePreprocessor that feeds `%run` cells from snapshots.
+
+    A cell made only of `%run` lines, whose notebooks all have a snapshot for
+    the notebook's directory in `snapshots`, restores their variables in the
+    kernel and gets their outputs, instead of running them.
+    """
+    def __init__(self, snapshots=None, **kw):
+        """
+        Args:
+            snapshots (dict): snapshot filename, directory and outputs of
+                each run notebook, keyed by its filename and the directory it
+                is run in, as made by `snapshot_dependency`.
+            **kw: arguments of ExecutePreprocessor.
+        """
+        super(SnapshotRunPreprocessor, self).__init__(**kw)
+        self.snapshots = snapshots or {}
+
+    def preprocess(self, nb, resources, km=None):
+        self.path = resources['metadata']['path']
+        return super(SnapshotRunPreprocessor, self).preprocess(nb, resources,
+                                                               km=km)
 
-class ExecuteOnlyVersionPreProcessor(ExecutePreprocessor):
+    def preprocess_cell(self, cell, resources, cell_index):
+        keys = [(target, self.path)
+                for target in run_targets(cell, self.path)]
+        if not keys or not all(key in self.snapshots for key in keys):
+            return super(SnapshotRunPreprocessor, self).preprocess_cell(
+                cell, resources, cell_index)
+        source = cell.source
+        cell.source = ''.join(RESTORE_CODE % (self.snapshots[key]['snapshot'],
+                                              self.snapshots[key]['directory'])
+                              for key in keys)
+        try:
+            cell, resources = super(SnapshotRunPreprocessor,
+                                    self).preprocess_cell(cell, resources,
+                                                          cell_index)
+            failed = any(output.output_type == 'error'
+                         for output in cell.outputs)
+        except CellExecutionError:
+            failed = True
+        finally:
+            cell.source = source
+        if failed:
+            # The snapshots could not be restored, so run the notebooks.
+            cell.outputs = []
+            return super(SnapshotRunPreprocessor, self).preprocess_cell(
+                cell, resources, cell_index)
+        cell.outputs = [nbformat.from_dict(output) for key in keys
+                        for output in self.snapshots[key]['outputs']]
+        return cell, resources
+
+
+class ExecuteOnlyVersionPreProcessor(SnapshotRunPreprocessor):
     """ExecutePreprocessor that only runs "version" cells."""
     def preprocess_cell(self, cell, resources, cell_index):
-        if cell.source.startswith('%run "../version.ipynb"'):
+        if is_version_cell(cell):
             return super(ExecuteOnlyVersionPreProcessor,
                          self).preprocess_cell(cell, resources, cell_index)
 
         return cell, resources
 
 
-def update_notebook_version_cell(filename):
+class WarmKernel(object):
+    """A kernel that is started once and reused for several notebooks.
+
+    The modules imported by the warmup code stay loaded, so their import cost
+    is only paid once per kernel rather than once per notebook.
+    """
+    def __init__(self, kernel_name='python3', warmup=WARMUP_CODE,
+                 timeout=600):
+        """Start the kernel and run the warmup code in it.
+
+        Args:
+            kernel_name (str): name of the kernel to start.
+            warmup (str): code to run once the kernel is ready. Errors in it
+                are ignored, since it only serves to speed things up.
+            timeout (int): seconds to wait for the kernel to be ready, and
+                for the warmup code.
+        """
+        self.timeout = timeout
+        self.km = KernelManager(kernel_name=kernel_name)
+        self.km.start_kernel()
+        if warmup:
+            self.execute(warmup)
+        self.execute('import sys as _sys\n'
+                     '_sys._warm_modules = set(_sys.modules)\n'
+                     'del _sys')
+
+    @property
+    def pid(self):
+        """int: process id of the kernel."""
+        return kernel_pid(self.km)
+
+    def execute(self, code):
+        """Run code in the kernel, discarding its output.
+
+        Returns:
+            bool: whether the code ran without errors.
+        """
+        client = self.km.client()
+        client.start_channels()
+        try:
+            client.wait_for_ready(timeout=self.timeout)
+            reply = client.execute_interactive(
+                code, store_history=False, timeout=self.timeout,
+                output_hook=lambda msg: None)
+        finally:
+            client.stop_channels()
+        return reply['content']['status'] == 'ok'
+
+    def reset(self, path):
+        """Prepare the kernel for running a new notebook in `path`."""
+        if not self.execute(RESET_CODE % path):
+            raise RuntimeError('Failed to reset the kernel')
+
+    def shutdown(self):
+        """Stop the kernel."""
+        self.km.shutdown_kernel(now=True)
+
+
+def read_notebook(filename):
+    """Return the notebook in a file."""
+    with open(filename) as f:
+        return nbformat.read(f, as_version=4)
+
+
+def write_notebook(filename, notebook):
+    """Save a notebook to a file."""
+    with open(filename, 'wt') as f:
+        nbformat.write(notebook, f)
+
+
+def update_notebook_version_cell(filename, kernel=None, snapshots=None):
     """Run a notebook's version cell, updating the file.
 
     Args:
         filename (str): jupyter notebook filename.
+        kernel (WarmKernel): kernel to run the notebook in. If None, a new
+            kernel is started and shut down afterwards.
+        snapshots (dict): snapshots of the notebooks run by `%run` cells, as
+            made by `snapshot_dependency`.
     """
     # Open the notebook.
     file_path = os.path.dirname(os.path.abspath(filename))
-    with open(filename) as f:
-        notebook = nbformat.read(f, as_version=4)
+    notebook = read_notebook(filename)
 
-    # Create the preprocessors.
-    version_preprocessor = ExecuteOnlyVersionPreProcessor(
-        timeout=600, kernel_name='python3')
-    normal_preprocessor = ExecutePreprocessor(
-        timeout=600, kernel_name='python3')
+    # Create the preprocessor.
+    if filename == 'version.ipynb':
+        preprocessor = SnapshotRunPreprocessor(
+            snapshots, timeout=600, kernel_name='python3')
+    else:
+        preprocessor = ExecuteOnlyVersionPreProcessor(
+            snapshots, timeout=600, kernel_name='python3')
+
+    # Execute the notebook.
+    run_preprocessor(preprocessor, notebook, file_path, kernel)
 
+    # Save the notebook.
+    write_notebook(filename, notebook)
+
+
+def run_preprocessor(preprocessor, notebook, path, kernel=None):
+    """Run an execute preprocessor on a notebook.
+
+    Args:
+        preprocessor (ExecutePreprocessor): preprocessor to run.
+        notebook (NotebookNode): notebook, updated in place.
+        path (str): directory the notebook is run in.
+        kernel (WarmKernel): kernel to run the notebook in. If None, a new
+            kernel is started and shut down afterwards.
+    """
     with warnings.catch_warnings():
         # Silence a file permissions warning on jupyter, which is still not
         # merged into the current release.
         # https://github.com/jupyter/jupyter_client/pull/201
         warnings.filterwarnings('ignore', 'Failed to set sticky bit',
                                 module='jupyter_client.connect')
-        # Execute the notebook.
-        if filename == 'version.ipynb':
-            normal_preprocessor.preprocess(notebook,
-                                           {'metadata': {'path': file_path}})
+        resources = {'metadata': {'path': path}}
+        if kernel is None:
+            preprocessor.preprocess(notebook, resources)
         else:
-            version_preprocessor.preprocess(notebook,
-                                            {'metadata': {'path': file_path}})
+            kernel.reset(path)
+            preprocessor.preprocess(notebook, resources, km=kernel.km)
 
-    # Save the notebook.
-    with open(filename, 'wt') as f:
-        nbformat.write(notebook, f)
 
+def _worker(connection, warm, update):
+    """Update the notebooks received from `connection`, until None is received.
 
-def main():
-    print('Updating the output of the version cell in notebooks ...')
+    The worker sends ('kernel', pid) whenever it starts a kernel, so that the
+    kernel can be killed if a notebook times out, and ('done', error) after
+    each notebook, with the error message or None on success.
+
+    Args:
+        connection (multiprocessing.connection.Connection): connection to
+            the parent process.
+        warm (bool): whether to reuse the kernel for all notebooks.
+        update (callable): function called with the filename and the kernel
+            to update each notebook.
+    """
+    kernel = None
+    try:
+        while True:
+            filename = connection.recv()
+            if filename is None:
+                break
+            try:
+                if kernel is None or not warm or not kernel.km.is_alive():
+                    if kernel is not None:
+                        kernel.shutdown()
+                    kernel = WarmKernel(warmup=WARMUP_CODE if warm else '')
+                    connection.send(('kernel', kernel.pid))
+                update(filename, kernel)
+                connection.send(('done', None))
+            except Exception as e:
+                connection.send(('done', '%s: %s' % (type(e).__name__, e)))
+    finally:
+        if kernel is not None:
+            kernel.shutdown()
+        connection.close()
+
+
+def _start_worker(warm, update):
+    """Start a worker process, returning the record used to track it."""
+    # The workers are spawned rather than forked: once this process has
+    # started a kernel client (to take the `%run` snapshots), it has event
+    # loop threads, and a forked child can hang waiting on them.
+    context = multiprocessing.get_context('spawn')
+    connection, child_connection = context.Pipe()
+    process = context.Process(target=_worker,
+                              args=(child_connection, warm, update))
+    process.start()
+    child_connection.close()
+    return {'process': process, 'connection': connection, 'kernel': None,
+            'task': None}
+
+
+def _kill_worker(worker):
+    """Kill a worker process, and its kernel."""
+    # Kernels are started in a session of their own.
+    if worker['kernel'] and hasattr(os, 'killpg'):
+        try:
+            os.killpg(worker['kernel'], signal.SIGKILL)
+        except OSError:
+            pass
+    worker['process'].kill()
+    worker['process'].join()
+    worker['connection'].close()
+
+
+def update_notebooks(filenames, jobs=1, timeout=None, warm=True, offset=0,
+                     total=None, update=update_notebook_version_cell):
+    """Update the version cell of several notebooks, running up to `jobs` at once.
+
+    Progress is printed in the order of `filenames`, as soon as all the
+    notebooks before it are done.
+
+    Args:
+        filenames (list[str]): jupyter notebook filenames.
+        jobs (int): number of worker processes.
+        timeout (float): seconds after which a notebook is abandoned, or None
+            for no limit. Its worker and kernel are killed.
+        warm (bool): whether each worker reuses its kernel for all notebooks.
+        offset (int): number of notebooks already reported, for the progress.
+        total (int): total number of notebooks, for the progress.
+        update (callable): function called with the filename and the kernel
+            to update each notebook, which must be picklable. By default, the
+            version cell is run.
+
+    Returns:
+        dict: error message for each notebook that failed.
+    """
+    total = total or len(filenames)
+    pending = list(enumerate(filenames))
+    workers = []
+    errors = {}
+    done = set()
+    next_to_report = 0
+    try:
+        while pending or any(worker['task'] for worker in workers):
+            # Hand out notebooks to the idle workers, starting more if needed.
+            for worker in workers:
+                if pending and worker['task'] is None:
+                    worker['task'] = (pending.pop(0)[0], time.time())
+                    worker['connection'].send(filenames[worker['task'][0]])
+            while pending and len(workers) < jobs:
+                worker = _start_worker(warm, update)
+                worker['task'] = (pending.pop(0)[0], time.time())
+                worker['connection'].send(filenames[worker['task'][0]])
+                workers.append(worker)
+
+            busy = [worker for worker in workers if worker['task']]
+            multiprocessing.connection.wait(
+                [worker['connection'] for worker in busy] +
+                [worker['process'].sentinel for worker in busy], timeout=1)
+            for worker in busy:
+                i, started = worker['task']
+                finished = False
+                error = None
+                try:
+                    while not finished and worker['connection'].poll():
+                        message, value = worker['connection'].recv()
+                        if message == 'kernel':
+                            worker['kernel'] = value
+                        else:
+                            finished, error = True, value
+                except (EOFError, OSError):
+                    pass
+                if not finished:
+                    if not worker['process'].is_alive():
+                        error = ('the worker exited with code %s' %
+                                 worker['process'].exitcode)
+                    elif timeout is not None and time.time() - started > timeout:
+                        error = 'timed out after %d seconds' % timeout
+                    else:
+                        continue
+                    _kill_worker(worker)
+                    workers.remove(worker)
+                worker['task'] = None
+                done.add(i)
+                if error is not None:
+                    errors[filenames[i]] = error
+
+            while next_to_report in done:
+                filename = filenames[next_to_report]
+                print('[%2d/%2d]: %s ... %s' % (
+                    offset + next_to_report + 1, total, filename,
+                    'failed' if filename in errors else 'done'))
+                sys.stdout.flush()
+                next_to_report += 1
+    finally:
+        for worker in workers:
+            try:
+                worker['connection'].send(None)
+            except OSError:
+                pass
+        for worker in workers:
+            worker['process'].join(30)
+            if worker['process'].is_alive():
+                _kill_worker(worker)
+
+    return errors
+
+
+def dependency_graph(filenames):
+    """Return the notebooks that each notebook runs with `%run` cells.
+
+    Only the notebooks in `filenames` are included, as the others are not
+    updated by the script.
+
+    Args:
+        filenames (list[str]): jupyter notebook filenames, relative to the
+            current directory.
+
+    Returns:
+        dict: set of the dependencies of each notebook.
+    """
+    known = set(filenames)
+    graph = {}
+    for filename in filenames:
+        path = os.path.dirname(os.path.abspath(filename))
+        graph[filename] = set(target
+                              for cell in read_notebook(filename).cells
+                              for target in run_targets(cell, path)
+                              if target in known and target != filename)
+    return graph
+
+
+def dependency_levels(graph):
+    """Sort a dependency graph topologically, in levels.
+
+    Args:
+        graph (dict): set of the dependencies of each notebook.
+
+    Returns:
+        list[list[str]]: the notebooks, grouped so that all the dependencies
+            of a notebook are in earlier groups.
+
+    Raises:
+        ValueError: if the notebooks run each other in a cycle.
+    """
+    levels = []
+    done = set()
+    remaining = sorted(graph)
+    while remaining:
+        level = [filename for filename in remaining
+                 if graph[filename] <= done]
+        if not level:
+            raise ValueError('The notebooks run each other in a cycle: ' +
+                             ', '.join(remaining))
+        levels.append(level)
+        done.update(level)
+        remaining = [filename for filename in remaining
+                     if filename not in done]
+    return levels
+
+
+def snapshot_dependency(target, path, snapshot, kernel):
+    """Run a notebook with `%run` and pickle the variables it defines.
+
+    Args:
+        target (str): filename of the notebook to run.
+        path (str): directory it is run from.
+        snapshot (str): filename to pickle the variables to.
+        kernel (WarmKernel): kernel to run it in.
+
+    Returns:
+        dict: the snapshot filename, the absolute directory of the notebook
+            (which `%run` puts on sys.path, so its modules may need it to be
+            imported again) and the outputs of the `%run` cell, or None if
+            some of the variables could not be pickled.
+    """
+    notebook = nbformat.v4.new_notebook(cells=[
+        nbformat.v4.new_code_cell(
+            '%%run %s' % json.dumps(os.path.relpath(target, path))),
+        nbformat.v4.new_code_cell(
+            SNAPSHOT_CODE % snapshot +
+            "print(__import__('sys')._snapshot_complete)")])
+    run_preprocessor(ExecutePreprocessor(timeout=600, kernel_name='python3'),
+                     notebook, path, kernel)
+    complete = ''.join(output.get('text', '')
+                       for output in notebook.cells[1].outputs)
+    if complete.strip() != 'True':
+        return None
+    return {'snapshot': snapshot,
+            'directory': os.path.abspath(os.path.dirname(target)),
+            'outputs': notebook.cells[0].outputs}
+
+
+def execute_notebooks(filenames, jobs=1, timeout=None, warm=True):
+    """Update the version cell of notebooks in the order of their `%run` cells.
+
+    The notebooks are run a level of the dependency graph at a time, several
+    at once within a level. Before each level, the notebooks it runs are run
+    once per directory they are run from, to snapshot their variables for
+    the `%run` cells. The notebooks whose dependencies failed are skipped.
+
+    Args:
+        filenames (list[str]): jupyter notebook filenames.
+        jobs (int): number of worker processes.
+        timeout (float): seconds after which a notebook is abandoned, or None
+            for no limit.
+        warm (bool): whether each worker reuses its kernel for all notebooks.
 
-    # Move "version.ipynb" to the front of the list.
-    NOTEBOOK_FILENAMES.insert(
-        0, NOTEBOOK_FILENAMES.pop(NOTEBOOK_FILENAMES.index('version.ipynb')))
-    for i, filename in enumerate(NOTEBOOK_FILENAMES):
-        print('[%2d/%2d]: %s ...' % (i+1, len(NOTEBOOK_FILENAMES), filename))
+    Returns:
+        dict: error message for each notebook that failed.
+    """
+    graph = dependency_graph(filenames)
+    snapshot_dir = tempfile.mkdtemp(prefix='rerun_version_')
+    snapshots = {}
+    errors = {}
+    done = 0
+    try:
+        for level in dependency_levels(graph):
+            ready = []
+            for filename in level:
+                failed = sorted(graph[filename] & set(errors))
+                if failed:
+                    errors[filename] = 'depends on %s, which failed' % (
+                        failed[0])
+                else:
+                    ready.append(filename)
+
+            # Snapshot the dependencies of the level, once per directory.
+            needed = set()
+            for filename in ready:
+                path = os.path.dirname(os.path.abspath(filename))
+                needed.update((target, path)
+                              for cell in read_notebook(filename).cells
+                              for target in run_targets(cell, path)
+                              if target in graph)
+            needed.difference_update(snapshots)
+            if needed:
+                kernel = WarmKernel(warmup=WARMUP_CODE if warm else '')
+                try:
+                    for target, path in sorted(needed):
+                        snapshot = os.path.join(snapshot_dir,
+                                                '%d.pkl' % len(snapshots))
+                        try:
+                            snapshots[target, path] = snapshot_dependency(
+                                target, path, snapshot, kernel)
+                        except Exception:
+                            # The dependents run it themselves instead.
+                            snapshots[target, path] = None
+                finally:
+                    kernel.shutdown()
+
+            update = functools.partial(
+                update_notebook_version_cell,
+                snapshots=dict((key, value)
+                               for key, value in snapshots.items() if value))
+            errors.update(update_notebooks(ready, jobs, timeout, warm, done,
+                                           len(filenames), update))
+            done += len(ready)
+            for filename in level:
+                if filename not in ready:
+                    done += 1
+                    print('[%2d/%2d]: %s ... skipped' % (done, len(filenames),
+                                                        filename))
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+    return errors
+
+
+def environment_fingerprint(requirements=REQUIREMENTS):
+    """Return a fingerprint of everything the version cell output depends on.
+
+    Args:
+        requirements (str): path of the requirements file displayed by the
+            version cell. It must exist, so that the fingerprint covers it
+            wherever the script is run from.
+
+    Returns:
+        str: sha256 of the Python version, the names and versions of the
+            installed distributions and the requirements file.
+    """
+    sha256 = hashlib.sha256(sys.version.encode('utf-8'))
+    distributions = sorted('%s==%s' % (dist.metadata['Name'], dist.version)
+                           for dist in metadata.distributions())
+    sha256.update('\n'.join(distributions).encode('utf-8'))
+    with open(requirements, 'rb') as requirements_file:
+        sha256.update(requirements_file.read())
+    return sha256.hexdigest()
+
+
+def splice_version_cell(filename, outputs, fingerprint):
+    """Copy the outputs of the version cell into a notebook, without running it.
+
+    Args:
+        filename (str): jupyter notebook filename.
+        outputs (list): outputs of the version cell of "version.ipynb".
+        fingerprint (str): fingerprint of the environment they come from.
+
+    Returns:
+        str: 'updated', 'up to date' or 'no version cell'.
+    """
+    notebook = read_notebook(filename)
+    cells = [cell for cell in notebook.cells if is_version_cell(cell)]
+    if not cells:
+        return 'no version cell'
+    if notebook.metadata.get('version_fingerprint') == fingerprint:
+        return 'up to date'
+    for cell in cells:
+        cell.outputs = copy.deepcopy(outputs)
+    notebook.metadata['version_fingerprint'] = fingerprint
+    write_notebook(filename, notebook)
+    return 'updated'
+
+
+def splice_notebooks(filenames, timeout=None):
+    """Update the version cells from a single execution of "version.ipynb".
+
+    Args:
+        filenames (list[str]): jupyter notebook filenames, other than
+            "version.ipynb".
+        timeout (float): seconds after which running "version.ipynb" is
+            abandoned, or None for no limit.
+
+    Returns:
+        dict: error message for each notebook that failed.
+    """
+    fingerprint = environment_fingerprint()
+    total = len(filenames) + 1
+    version = read_notebook('version.ipynb')
+    if version.metadata.get('version_fingerprint') == fingerprint:
+        print('[%2d/%2d]: %s ... up to date' % (1, total, 'version.ipynb'))
+    else:
+        errors = update_notebooks(['version.ipynb'], 1, timeout, False, 0,
+                                  total)
+        if errors:
+            return errors
+        version = read_notebook('version.ipynb')
+        version.metadata['version_fingerprint'] = fingerprint
+        write_notebook('version.ipynb', version)
+    outputs = [cell.outputs for cell in version.cells
+               if cell.cell_type == 'code'][0]
+
+    errors = {}
+    for i, filename in enumerate(filenames):
         try:
-            update_notebook_version_cell(filename)
+            status = splice_version_cell(filename, outputs, fingerprint)
         except Exception as e:
-            print('An error ocurred: %s' % str(e))
+            errors[filename] = '%s: %s' % (type(e).__name__, e)
+            status = 'failed'
+        print('[%2d/%2d]: %s ... %s' % (i + 2, total, filename, status))
+    return errors
+
+
+# Code run in the kernel before profiling a notebook. It counts the jobs
+# created by any qiskit backend, including the simulators. The counter is kept
+# in the sys module, where resetting the user namespace does not affect it.
+JOB_COUNTER_CODE = """
+def _install_job_counter():
+    import qiskit.providers
+    counter = [0]
+    for name in ['BaseJob', 'JobV1']:
+        cls = getattr(qiskit.providers, name, None)
+        if cls is None:
+            continue
+        def counting_init(self, *args, _init=cls.__init__, **kwargs):
+            counter[0] += 1
+            _init(self, *args, **kwargs)
+        cls.__init__ = counting_init
+    return counter
+import sys as _sys
+try:
+    _sys._job_counter = _install_job_counter()
+except ImportError:
+    _sys._job_counter = [0]
+del _install_job_counter, _sys
+"""
+
+
+def wait_for(value):
+    """Return the result of a call to a kernel client.
+
+    The clients of the kernels that nbclient starts itself are asynchronous,
+    and their calls return coroutines, which are run to completion. Those of
+    a KernelManager, as used by WarmKernel, are blocking and return results.
+    """
+    if run_sync is None:
+        return value
+    return run_sync(ensure_async)(value)
+
+
+def evaluate(client, expression, timeout, code=''):
+    """Return the repr of an expression evaluated silently in a kernel.
+
+    Args:
+        client (KernelClient): client of the kernel, blocking or
+            asynchronous.
+        expression (str): expression to evaluate.
+        timeout (float): seconds to wait for the reply.
+        code (str): code to run before evaluating the expression.
+
+    Returns:
+        str: the text/plain repr of the value, or None if it failed.
+    """
+    msg_id = client.execute(code, silent=True, store_history=False,
+                            user_expressions={'value': expression})
+    while True:
+        reply = wait_for(client.get_shell_msg(timeout=timeout))
+        if reply['parent_header'].get('msg_id') == msg_id:
+            break
+    value = reply['content']['user_expressions']['value']
+    return value['data']['text/plain'] if value['status'] == 'ok' else None
+
+
+def _read_peak_rss(pid, reset=False):
+    """Return the peak RSS of a process in KiB, or None if it is unavailable.
+
+    Args:
+        pid (int): process id.
+        reset (bool): whether to reset the peak to the current RSS afterwards
+            (Linux only).
+    """
+    try:
+        with open('/proc/%d/status' % pid) as status:
+            peak = [int(line.split()[1]) for line in status
+                    if line.startswith('VmHWM:')][0]
+        if reset:
+            with open('/proc/%d/clear_refs' % pid, 'w') as clear_refs:
+                clear_refs.write('5')
+        return peak
+    except (IOError, IndexError, ValueError):
+        return None
+
+
+class ProfilingPreprocessor(ExecutePreprocessor):
+    """ExecutePreprocessor that records the cost of each cell it runs.
+
+    After preprocessing, `cells` holds a dict for each code cell with its
+    index, first line, start time and wall time in seconds, the peak RSS of
+    the kernel in KiB while it ran and the number of jobs it submitted.
+    """
+    def preprocess(self, nb, resources, km=None):
+        self.cells = []
+        self._job_count = None
+        return super(ProfilingPreprocessor, self).preprocess(nb, resources,
+                                                             km=km)
+
+    def evaluate(self, expression):
+        """Return the repr of an expression evaluated silently in the kernel."""
+        return evaluate(self.kc, expression, self.timeout)
+
+    def preprocess_cell(self, cell, resources, cell_index):
+        if cell.cell_type != 'code':
+            return cell, resources
+        if self._job_count is None:
+            wait_for(self.kc.execute_interactive(JOB_COUNTER_CODE, silent=True,
+                                                 timeout=self.timeout))
+            self._job_count = 0
+        pid = kernel_pid(self.km)
+        _read_peak_rss(pid, reset=True)
+        record = {'index': cell_index,
+                  'source': cell.source.split('\n')[0][:80],
+                  'start': time.time()}
+        self.cells.append(record)
+        started = time.perf_counter()
+        try:
+            return super(ProfilingPreprocessor, self).preprocess_cell(
+                cell, resources, cell_index)
+        finally:
+            record['wall_s'] = time.perf_counter() - started
+            record['peak_rss_kib'] = _read_peak_rss(pid)
+            job_count = int(self.evaluate("__import__('sys')._job_counter[0]")
+                            or 0)
+            record['jobs'] = job_count - self._job_count
+            self._job_count = job_count
+
+
+def qiskit_versions():
+    """Return the versions of the installed qiskit distributions."""
+    return dict(sorted((dist.metadata['Name'], dist.version)
+                       for dist in metadata.distributions()
+                       if dist.metadata['Name'].lower().startswith('qiskit')))
+
+
+def profile_notebooks(filenames, report, trace=None):
+    """Run every cell of the notebooks, recording the cost of each cell.
+
+    The notebooks are run one at a time, so that they do not affect each
+    other's timings, and are not saved.
+
+    Args:
+        filenames (list[str]): jupyter notebook filenames.
+        report (str): file to write the JSON report to.
+        trace (str): file to write a Chrome trace to, or None.
+
+    Returns:
+        dict: error message for each notebook that failed.
+    """
+    results = []
+    errors = {}
+    for i, filename in enumerate(filenames):
+        notebook = read_notebook(filename)
+        preprocessor = ProfilingPreprocessor(timeout=600,
+                                             kernel_name='python3')
+        resources = {'metadata': {
+            'path': os.path.dirname(os.path.abspath(filename))}}
+        started = time.time()
+        try:
+            preprocessor.preprocess(notebook, resources)
+            error = None
+        except Exception as e:
+            error = errors[filename] = '%s: %s' % (type(e).__name__, e)
+        cells = getattr(preprocessor, 'cells', [])
+        results.append({'notebook': filename, 'start': started,
+                        'wall_s': time.time() - started,
+                        'jobs': sum(cell.get('jobs', 0) for cell in cells),
+                        'error': error, 'cells': cells})
+        print('[%2d/%2d]: %s ... %.1f s, %d jobs%s' % (
+            i + 1, len(filenames), filename, results[-1]['wall_s'],
+            results[-1]['jobs'], ', failed' if error else ''))
+        sys.stdout.flush()
+
+    with open(report, 'w') as report_file:
+        json.dump({'python': sys.version.split()[0],
+                   'qiskit': qiskit_versions(),
+                   'notebooks': results}, report_file, indent=1)
+    if trace:
+        with open(trace, 'w') as trace_file:
+            json.dump(chrome_trace(results), trace_file)
+    return errors
+
+
+def chrome_trace(results):
+    """Convert profiling results to the Chrome trace event format.
+
+    Each notebook is shown as a process, with a span for the whole notebook
+    and one for each of its cells.
+    """
+    events = []
+    origin = min([result['start'] for result in results] or [0])
+    for pid, result in enumerate(results):
+        events.append({'name': 'process_name', 'ph': 'M', 'pid': pid,
+                       'args': {'name': result['notebook']}})
+        events.append({'name': result['notebook'], 'cat': 'notebook',
+                       'ph': 'X', 'pid': pid, 'tid': 0,
+                       'ts': (result['start'] - origin) * 1e6,
+                       'dur': result['wall_s'] * 1e6,
+                       'args': {'jobs': result['jobs'],
+                                'error': result['error']}})
+        for cell in result['cells']:
+            events.append({'name': '[%d] %s' % (cell['index'], cell['source']),
+                           'cat': 'cell', 'ph': 'X', 'pid': pid, 'tid': 0,
+                           'ts': (cell['start'] - origin) * 1e6,
+                           'dur': cell.get('wall_s', 0) * 1e6,
+                           'args': {'jobs': cell.get('jobs'),
+                                    'peak_rss_kib': cell.get('peak_rss_kib')}})
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def compare_reports(old_report, new_report, threshold=1.2, min_time=0.1):
+    """Print the notebooks and cells that got slower between two reports.
+
+    Args:
+        old_report (str): filename of the earlier JSON report.
+        new_report (str): filename of the later JSON report.
+        threshold (float): ratio of wall times above which a change is shown.
+        min_time (float): cells faster than this many seconds in both reports
+            are ignored, as their timings are mostly noise.
+    """
+    with open(old_report) as old_file, open(new_report) as new_file:
+        old, new = json.load(old_file), json.load(new_file)
+    print('\nqiskit: %s -> %s' % (old['qiskit'], new['qiskit']))
+    old_notebooks = {result['notebook']: result for result in old['notebooks']}
+    for result in new['notebooks']:
+        before = old_notebooks.get(result['notebook'])
+        if before is None:
+            continue
+        old_cells = {cell['index']: cell for cell in before['cells']}
+        lines = []
+        for cell in result['cells']:
+            old_cell = old_cells.get(cell['index'])
+            if old_cell is None or 'wall_s' not in cell:
+                continue
+            if max(cell['wall_s'], old_cell['wall_s']) < min_time:
+                continue
+            if cell['wall_s'] > threshold * old_cell['wall_s']:
+                lines.append('    cell %d: %.2f s -> %.2f s  %s' % (
+                    cell['index'], old_cell['wall_s'], cell['wall_s'],
+                    cell['source']))
+        if lines or result['wall_s'] > threshold * before['wall_s']:
+            print('%s: %.1f s -> %.1f s' % (result['notebook'],
+                                            before['wall_s'],
+                                            result['wall_s']))
+            print('\n'.join(lines))
+
+
+# Code run in the kernel after each cell run with a cache, with the filename
+# of the snapshot. It pickles the variables of the user namespace, keeping
+# only the names of the modules, and records in the sys module whether all
+# of them could be pickled. cloudpickle is used if it is installed, so that
+# the functions and classes defined in the notebook can be pickled too.
+SNAPSHOT_CODE = """
+def _snapshot(path):
+    import os, pickle, types
+    try:
+        import cloudpickle as pickler
+    except ImportError:
+        pickler = pickle
+    shell = get_ipython()
+    modules, values, complete = {}, {}, True
+    for name, value in list(shell.user_ns.items()):
+        if name.startswith('_') or name in shell.user_ns_hidden:
+            continue
+        if isinstance(value, types.ModuleType):
+            modules[name] = value.__name__
+            continue
+        try:
+            values[name] = pickler.dumps(value)
+        except Exception:
+            complete = False
+    with open(path + '.tmp', 'wb') as snapshot_file:
+        pickle.dump({'modules': modules, 'values': values}, snapshot_file)
+    os.replace(path + '.tmp', path)
+    return complete
+import sys as _sys
+_sys._snapshot_complete = _snapshot(%r)
+del _snapshot, _sys
+"""
+
+# Code run in the kernel to restore a snapshot, with its filename and the
+# directory to put on sys.path while the modules are imported (or None). A
+# notebook run with `%run` can import modules relative to its own directory,
+# which is only on sys.path while it runs.
+RESTORE_CODE = """
+def _restore(path, directory):
+    import importlib, pickle, sys
+    with open(path, 'rb') as snapshot_file:
+        snapshot = pickle.load(snapshot_file)
+    namespace = get_ipython().user_ns
+    if directory is not None:
+        sys.path.insert(0, directory)
+    try:
+        for name, module in snapshot['modules'].items():
+            namespace[name] = importlib.import_module(module)
+        for name, value in snapshot['values'].items():
+            namespace[name] = pickle.loads(value)
+    finally:
+        if directory is not None:
+            sys.path.remove(directory)
+_restore(%r, %r)
+del _restore
+"""
+
+
+class CachingPreprocessor(ExecutePreprocessor):
+    """ExecutePreprocessor that reuses the outputs of unchanged cells.
+
+    Each code cell is keyed by the sha256 of its source chained with the key
+    of the code cell before it, starting from `seed`, so that a key only
+    matches if the cell and all the cells before it are unchanged. The
+    outputs of the cells before the first one missing from the cache are
+    reused, and the kernel is given their state by restoring the snapshot of
+    the variables taken after the last of them.
+
+    Only the variables are restored: changes made by the reused cells to the
+    working directory, files or other modules are not. After preprocessing,
+    `executed` holds the number of cells that were run.
+    """
+    def __init__(self, cache_dir, seed='', **kw):
+        """
+        Args:
+            cache_dir (str): directory holding the cached outputs and
+                snapshots.
+            seed (str): string the keys of the cells depend on, besides their
+                sources, such as the notebook name and environment.
+            **kw: arguments of ExecutePreprocessor.
+        """
+        super(CachingPreprocessor, self).__init__(**kw)
+        self.cache_dir = cache_dir
+        self.seed = seed
+
+    def cache_path(self, key, extension):
+        """Return the filename of a cached cell's outputs or snapshot."""
+        return os.path.join(self.cache_dir, key[:2], key + extension)
+
+    def load_entry(self, key):
+        """Return the cached entry of a cell, or None if it is missing."""
+        try:
+            with open(self.cache_path(key, '.json')) as entry_file:
+                entry = json.load(entry_file)
+        except (IOError, ValueError):
+            return None
+        if entry['snapshot'] and not os.path.exists(
+                self.cache_path(key, '.pkl')):
+            entry['snapshot'] = False
+        return entry
+
+    def store_entry(self, key, cell):
+        """Snapshot the kernel and cache the outputs of a cell that was run."""
+        os.makedirs(os.path.dirname(self.cache_path(key, '.json')),
+                    exist_ok=True)
+        complete = evaluate(self.kc, "__import__('sys')._snapshot_complete",
+                            self.timeout,
+                            SNAPSHOT_CODE % self.cache_path(key, '.pkl'))
+        entry = {'outputs': cell.outputs,
+                 'execution_count': cell.execution_count,
+                 'snapshot': complete == 'True'}
+        filename = self.cache_path(key, '.json')
+        with open(filename + '.tmp', 'w') as entry_file:
+            json.dump(entry, entry_file)
+        os.replace(filename + '.tmp', filename)
+
+    def preprocess(self, nb, resources, km=None):
+        self.keys = {}
+        key = hashlib.sha256(self.seed.encode('utf-8')).hexdigest()
+        for index, cell in enumerate(nb.cells):
+            if cell.cell_type == 'code':
+                key = hashlib.sha256(
+                    (key + cell.source).encode('utf-8')).hexdigest()
+                self.keys[index] = key
+
+        # Find the cached prefix, and the snapshot taken at its end.
+        self.reused = {}
+        self._restore = None
+        self.executed = 0
+        for index in sorted(self.keys):
+            entry = self.load_entry(self.keys[index])
+            if entry is None:
+                break
+            self.reused[index] = entry
+            self._restore = self.keys[index] if entry['snapshot'] else None
+        else:
+            # Every cell is cached, so no kernel is needed.
+            for index, entry in self.reused.items():
+                self.reuse_cell(nb.cells[index], entry)
+            return nb, resources
+        if self._restore is None:
+            self.reused = {}
+        return super(CachingPreprocessor, self).preprocess(nb, resources,
+                                                           km=km)
+
+    def reuse_cell(self, cell, entry):
+        """Copy the cached outputs of a cell into it."""
+        cell.outputs = [nbformat.from_dict(output)
+                        for output in entry['outputs']]
+        cell.execution_count = entry['execution_count']
+
+    def preprocess_cell(self, cell, resources, cell_index):
+        if cell.cell_type != 'code':
+            return cell, resources
+        if self._restore is not None:
+            reply = wait_for(self.kc.execute_interactive(
+                RESTORE_CODE % (self.cache_path(self._restore, '.pkl'), None),
+                silent=True, store_history=False, timeout=self.timeout,
+                output_hook=lambda msg: None))
+            self._restore = None
+            if reply['content']['status'] != 'ok':
+                # Nothing was reused yet, so run the whole notebook instead.
+                self.reused = {}
+        if cell_index in self.reused:
+            self.reuse_cell(cell, self.reused[cell_index])
+            return cell, resources
+        cell, resources = super(CachingPreprocessor, self).preprocess_cell(
+            cell, resources, cell_index)
+        self.executed += 1
+        self.store_entry(self.keys[cell_index], cell)
+        return cell, resources
+
+
+def execute_notebook_cached(filename, kernel=None, cache_dir=None,
+                            fingerprint=''):
+    """Run every cell of a notebook, reusing cached outputs, and save it.
+
+    Args:
+        filename (str): jupyter notebook filename.
+        kernel (WarmKernel): kernel to run the notebook in. If None, a new
+            kernel is started and shut down afterwards.
+        cache_dir (str): directory holding the cached outputs and snapshots.
+        fingerprint (str): fingerprint of the environment, so that nothing is
+            reused once it changes.
+    """
+    file_path = os.path.dirname(os.path.abspath(filename))
+    notebook = read_notebook(filename)
+    before = nbformat.writes(notebook)
+    preprocessor = CachingPreprocessor(
+        cache_dir, '%s\n%s' % (fingerprint, filename),
+        timeout=600, kernel_name='python3')
+    run_preprocessor(preprocessor, notebook, file_path, kernel)
+    if nbformat.writes(notebook) != before:
+        write_notebook(filename, notebook)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Update the output of the version cell in notebooks.')
+    parser.add_argument('--execute', action='store_true',
+                        help='run the version cell of every notebook in a '
+                             'kernel, instead of copying the output of '
+                             '"version.ipynb"')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of notebooks updated at the same time, '
+                             '0 for one per core (default: 1)')
+    parser.add_argument('--timeout', type=float, default=1800,
+                        help='seconds after which a notebook is abandoned '
+                             '(default: 1800)')
+    parser.add_argument('--no-warm', dest='warm', action='store_false',
+                        help='start a new kernel for every notebook, instead '
+                             'of reusing one per worker')
+    parser.add_argument('--profile', metavar='REPORT',
+                        help='run every cell of every notebook, writing the '
+                             'cost of each cell to REPORT as JSON')
+    parser.add_argument('--trace', metavar='TRACE',
+                        help='with --profile, also write a Chrome trace')
+    parser.add_argument('--compare', metavar='OLD_REPORT',
+                        help='with --profile, list the cells that got slower '
+                             'since OLD_REPORT')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='run every cell of every notebook, reusing the '
+                             'outputs cached in DIR for the cells before the '
+                             'first changed one')
+    args = parser.parse_args()
+    jobs = args.jobs or os.cpu_count()
+
+    if args.cache:
+        print('Running all the cells of the notebooks, cached in %s ...' %
+              args.cache)
+        update = functools.partial(execute_notebook_cached,
+                                   cache_dir=os.path.abspath(args.cache),
+                                   fingerprint=environment_fingerprint())
+        errors = update_notebooks(NOTEBOOK_FILENAMES, jobs, args.timeout,
+                                  args.warm, update=update)
+        if errors:
+            print('\n%d of %d notebooks failed:' % (len(errors),
+                                                     len(NOTEBOOK_FILENAMES)))
+            for filename in NOTEBOOK_FILENAMES:
+                if filename in errors:
+                    print('  %s: %s' % (filename, errors[filename]))
+            sys.exit(1)
+        return
+
+    if args.profile:
+        print('Profiling all the cells of the notebooks ...')
+        errors = profile_notebooks(NOTEBOOK_FILENAMES, args.profile,
+                                   args.trace)
+        if args.compare:
+            compare_reports(args.compare, args.profile)
+        if errors:
+            print('\n%d of %d notebooks failed:' % (len(errors),
+                                                     len(NOTEBOOK_FILENAMES)))
+            for filename in NOTEBOOK_FILENAMES:
+                if filename in errors:
+                    print('  %s: %s' % (filename, errors[filename]))
+        return
+
+    print('Updating the output of the version cell in notebooks ...')
+
+    if args.execute:
+        errors = execute_notebooks(NOTEBOOK_FILENAMES, jobs, args.timeout,
+                                   args.warm)
+    else:
+        # "version.ipynb" is run on its own first, as its output is copied.
+        NOTEBOOK_FILENAMES.remove('version.ipynb')
+        errors = splice_notebooks(NOTEBOOK_FILENAMES, args.timeout)
+        NOTEBOOK_FILENAMES.insert(0, 'version.ipynb')
+    total = len(NOTEBOOK_FILENAMES)
+
+    if errors:
+        print('\n%d of %d notebooks failed:' % (len(errors), total))
+        for filename in NOTEBOOK_FILENAMES:
+            if filename in errors:
+                print('  %s: %s' % (filename, errors[filename]))
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -14,14 +14,140 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 # =============================================================================
-"""Utils for displaying the versions required by the QISKit tutorials."""
+"""Utils for displaying the versions required by the QISKit tutorials.
 
+The requirements and the installed versions of the required distributions
+are computed once per environment, and cached on disk, in a manifest keyed
+by the interpreter, the modification times of the site-packages directories
+and the requirements file. Displaying the table only reads that manifest,
+unless something was installed or the requirements changed since.
+"""
+
+import hashlib
+import json
+import os
+import re
+import site
+import sys
 from html import escape
 from os import path
 
-from pkg_resources import Requirement
 from IPython.core.display import display, HTML
 
+try:
+    from importlib import metadata
+except ImportError:
+    import importlib_metadata as metadata
+
+
+CACHE_DIR = path.join(os.environ.get('XDG_CACHE_HOME') or
+                      path.join(path.expanduser('~'), '.cache'),
+                      'qiskit_tutorials')
+
+# A requirement: its name, optional extras and the rest of the line.
+REQUIREMENT = re.compile(r'\s*([A-Za-z0-9][A-Za-z0-9._-]*)\s*'
+                         r'(?:\[[^\]]*\])?(.*)')
+SPECIFIER = re.compile(r'(~=|===|==|!=|<=|>=|<|>)\s*([^\s,;]+)')
+
+
+def find_requirements():
+    """Return the path of the requirements file of the tutorials."""
+    filename = 'requirements.txt'
+    # If the notebook is run from another one, the path will be the parent's.
+    if not path.exists(filename):
+        filename = '../requirements.txt'
+    return path.abspath(filename)
+
+
+def parse_requirement(line):
+    """Return the name and the (operator, version) specifiers of a requirement.
+
+    Returns:
+        tuple: the name and a list of specifiers, or None if the line is
+            blank or a comment.
+    """
+    line = line.split('#')[0].strip()
+    if not line:
+        return None
+    name, rest = REQUIREMENT.match(line).groups()
+    return name, SPECIFIER.findall(rest.split(';')[0])
+
+
+def installed_version(name):
+    """Return the installed version of a distribution, or None."""
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def manifest_key(requirements):
+    """Return the key of the manifest for the current environment.
+
+    Args:
+        requirements (str): path of the requirements file.
+
+    Returns:
+        str: sha1 of the interpreter, the modification times of the
+            site-packages directories and of the requirements file.
+    """
+    directories = site.getsitepackages() if hasattr(site, 'getsitepackages') \
+        else []
+    directories.append(site.getusersitepackages())
+    stamps = [sys.executable, sys.version]
+    for filename in [requirements] + sorted(set(directories)):
+        try:
+            stamps.append('%s %d' % (filename, os.stat(filename).st_mtime_ns))
+        except OSError:
+            pass
+    return hashlib.sha1('\n'.join(stamps).encode('utf-8')).hexdigest()
+
+
+def environment_manifest(requirements=None, cache_dir=CACHE_DIR):
+    """Return the requirements of the tutorials and their installed versions.
+
+    The manifest is read from the cache if the environment has not changed,
+    and computed and cached otherwise.
+
+    Args:
+        requirements (str): path of the requirements file, found relative to
+            the current directory by default.
+        cache_dir (str): directory holding the cached manifests, or None to
+            not cache them.
+
+    Returns:
+        dict: a list of requirements, each a dict with the 'name', the
+            [operator, version] 'specs' and the 'installed' version.
+    """
+    requirements = requirements or find_requirements()
+    cache = None
+    if cache_dir:
+        cache = path.join(cache_dir, 'version_manifest_%s.json' %
+                          manifest_key(requirements))
+        try:
+            with open(cache) as cache_file:
+                return json.load(cache_file)
+        except (IOError, ValueError):
+            pass
+
+    with open(requirements, 'r') as requirements_file:
+        parsed = [parse_requirement(line) for line in requirements_file]
+    manifest = {'requirements': [
+        {'name': name, 'specs': [list(spec) for spec in specs],
+         'installed': installed_version(name)}
+        for name, specs in filter(None, parsed)]}
+
+    if cache:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            with open(cache + '.tmp', 'w') as cache_file:
+                json.dump(manifest, cache_file)
+            os.replace(cache + '.tmp', cache)
+        except OSError:
+            # The manifest is only cached to save time.
+            pass
+    return manifest
+
 
 def version_information(sdk_develop=False):
     """Return an HTML table with the contents of requirements.txt"""
@@ -32,28 +158,21 @@ def version_information(sdk_develop=False):
         else:
             return escape(operator)
 
-    def requirement_as_row(requirement: Requirement):
-        """Return a Requirement as an HTML table row."""
-        tds = [requirement.name, '']
+    def requirement_as_row(requirement):
+        """Return a requirement of the manifest as an HTML table row."""
+        tds = [requirement['name'], '']
         tds[1] = ', '.join(['{} {}'.format(escaped_operator(operator), target)
-                            for operator, target in sorted(requirement.specs,
-                                                           reverse=True)])
+                            for operator, target in sorted(
+                                requirement['specs'], reverse=True)])
 
         # If the version of QISKIT is not specified, show development branch.
-        if sdk_develop and requirement.name == 'QISKit':
+        if sdk_develop and requirement['name'] == 'QISKit':
             tds[1] = '(git master branch)'
 
         return '<tr>{}</tr>'.format(''.join(['<td>{}</td>'.format(td) for
                                              td in tds]))
 
-    filename = 'requirements.txt'
-    # If the notebook is run from another one, the path will be the parent's.
-    if not path.exists(filename):
-        filename = '../requirements.txt'
-
-    with open(filename, 'r') as requirements_file:
-        str_requirements = requirements_file.readlines()
-        requirements = [Requirement(i) for i in str_requirements]
+    requirements = environment_manifest()['requirements']
 
     qiskit_branch = '<b>stable</b>'
     if sdk_develop:
@@ -0,0 +1,112 @@
+# run this to benchmark the time taken to import the game engines
+#
+# Each module in games/game_engines is imported in a new process, several
+# times, and the wall time of the import, the peak RSS of the process and the
+# display libraries that the import loaded are recorded. The game logic of
+# each engine should load none of them: matplotlib, ipywidgets, IPython and
+# networkx are only needed by the rendering layers, which are benchmarked
+# alongside for comparison. The results are written to a JSON file, and can
+# be compared against those of an earlier run:
+#
+#     python benchmark_imports.py --output before.json
+#     python benchmark_imports.py --output after.json --compare before.json
+
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+
+ENGINES = os.path.join(os.path.dirname(os.path.abspath(__file__)),'games','game_engines')
+MODULES = ['hello_quantum','quantum_slot','universal','hello_quantum_display','quantum_slot.quantum_slot','universal_display']
+DISPLAY_MODULES = ['matplotlib','ipywidgets','IPython','networkx']
+
+# run in the new process, with the module name as its argument
+IMPORT_CODE = '''
+import sys, time, json
+start = time.perf_counter()
+import importlib
+importlib.import_module(sys.argv[1])
+wall = time.perf_counter()-start
+print(json.dumps({'import_s':wall, 'loaded':[name for name in %r if name in sys.modules]}))
+''' % DISPLAY_MODULES
+
+def run_import(module):
+    # Imports the module in a new process. Returns the time taken by the import, the peak RSS in KiB and the display modules loaded.
+
+    # stderr goes to the same pipe as stdout, so that the child cannot block on one pipe while the other is being read.
+    # The peak RSS is measured as in benchmark_indexer.py, from the rusage of the process when it is reaped.
+    process = subprocess.Popen([sys.executable, '-c', IMPORT_CODE, module], cwd=ENGINES,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    output = process.stdout.read().decode(errors='replace').strip().splitlines() or ['']
+    process.stdout.close()
+    _, status, rusage = os.wait4(process.pid,0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode!=0:
+        raise RuntimeError('importing %s failed: %s' % (module,output[-1]))
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    peak_rss = rusage.ru_maxrss//1024 if sys.platform=='darwin' else rusage.ru_maxrss
+    # the result is the last line, after any warnings printed by the import
+    result = json.loads(output[-1])
+    return result['import_s'], peak_rss, result['loaded']
+
+def benchmark(module, repeat):
+    # Returns the results of importing the module repeat times.
+
+    times = []
+    rss = []
+    for _ in range(repeat):
+        wall, peak_rss, loaded = run_import(module)
+        times.append(wall)
+        rss.append(peak_rss)
+    return {'module':module, 'repeat':repeat, 'median_s':statistics.median(times), 'min_s':min(times),
+            'peak_rss_kib':max(rss), 'loaded':loaded}
+
+def print_results(results, baseline=None):
+    # Prints a table of the results, with the ratio to the baseline's median time where available.
+
+    old = {result['module']:result for result in (baseline or [])}
+    print('%-26s %10s %10s %10s  %-36s %s' % ('module','median (s)','min (s)','RSS (KiB)','display modules loaded','vs baseline'))
+    for result in results:
+        line = '%-26s %10.3f %10.3f %10d  %-36s' % (result['module'],result['median_s'],result['min_s'],
+                                                   result['peak_rss_kib'],','.join(result['loaded']) or '-')
+        before = old.get(result['module'])
+        if before:
+            line += ' time x%.2f, RSS x%.2f' % (result['median_s']/before['median_s'], result['peak_rss_kib']/before['peak_rss_kib'])
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the time taken to import the game engines.')
+    parser.add_argument('--modules', default=','.join(MODULES),
+                        help='comma separated modules to import from games/game_engines (default: '+','.join(MODULES)+')')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='number of times that each module is imported (default: 5)')
+    parser.add_argument('--output', default='imports_benchmark.json',
+                        help='file to write the results to (default: imports_benchmark.json)')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+
+    results = []
+    for module in args.modules.split(','):
+        print('Benchmarking import %s ...' % module)
+        try:
+            results.append(benchmark(module,args.repeat))
+        except RuntimeError as error:
+            print(error)
+
+    with open(args.output,'w') as file:
+        json.dump({'python':platform.python_version(), 'platform':platform.platform(), 'cpus':os.cpu_count(),
+                   'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'results':results}, file, indent=1)
+    print_results(results,baseline)
+
+if __name__ == '__main__':
+    main()
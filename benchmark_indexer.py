@@ -0,0 +1,179 @@
+# run this to benchmark indexer.py on synthetic notebook trees
+#
+# For each combination of tree size, embedded images and position of the
+# keywords cell, a tree of synthetic notebooks is generated and indexed twice
+# with `indexer.py --incremental`:
+#
+# * cold: no manifest or database exists yet, so every notebook is parsed.
+# * warm: a small fraction of the notebooks has been changed since the cold run.
+#
+# Each run is a separate process, for which the wall time, CPU time, peak RSS
+# and notebooks per second are recorded. The results are written to a JSON file,
+# and can be compared against those of an earlier run:
+#
+#     python benchmark_indexer.py --sizes 100,1000 --output before.json
+#     python benchmark_indexer.py --sizes 100,1000 --output after.json --compare before.json
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+
+INDEXER = os.path.join(os.path.dirname(os.path.abspath(__file__)),'indexer.py')
+WORDS = ['qubit','circuit','gate','measure','superposition','entanglement','state','basis','noise','backend',
+         'simulator','register','amplitude','phase','oracle','algorithm','hadamard','bell','error','result']
+TOPICS = ['Games','Entanglement','Superposition','Ignis','Creative','Algorithms']
+COMMANDS = ['`h`','`cx`','`x`','`z`','`measure`','`execute`']
+
+def markdown_cell(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(20,80))]
+    return {'cell_type':'markdown', 'metadata':{}, 'source':['# '+words[0]+'\n', '\n', ' '.join(words[1:])]}
+
+def code_cell(rng, image_size):
+    source = ['qc.'+rng.choice(['h','x','z','measure'])+'(q['+str(j%2)+'])\n' for j in range(rng.randint(2,10))]
+    outputs = [{'name':'stdout', 'output_type':'stream', 'text':["{'00': 512, '11': 512}\n"]}]
+    if image_size:
+        png = base64.b64encode(rng.randbytes(image_size)).decode('ascii')
+        outputs.append({'data':{'image/png':png, 'text/plain':['<Figure size 432x288 with 1 Axes>']},
+                        'metadata':{'needs_background':'light'}, 'output_type':'display_data'})
+    return {'cell_type':'code', 'execution_count':1, 'metadata':{}, 'outputs':outputs, 'source':source}
+
+def keywords_cell(rng):
+    keywords = {'Topics':rng.sample(TOPICS,2), 'Commands':rng.sample(COMMANDS,3)}
+    return {'cell_type':'code', 'execution_count':None, 'metadata':{}, 'outputs':[], 'source':['keywords = '+repr(keywords)]}
+
+def make_notebook(rng, cells, image_size, keywords_at):
+    # Returns a notebook with the given number of alternating markdown and code cells.
+    # keywords_at is 'start', 'middle', 'end' or 'none'.
+
+    nb_cells = [markdown_cell(rng) if j%2==0 else code_cell(rng,image_size) for j in range(cells)]
+    position = {'start':0, 'middle':cells//2, 'end':cells}.get(keywords_at)
+    if position is not None:
+        nb_cells.insert(position,keywords_cell(rng))
+    return {'cells':nb_cells, 'metadata':{'kernelspec':{'display_name':'Python 3','language':'python','name':'python3'}},
+            'nbformat':4, 'nbformat_minor':2}
+
+def write_notebook(filename, notebook):
+    with open(filename,'w') as file:
+        json.dump(notebook,file,indent=1)
+
+def make_tree(root, notebooks, cells, image_size, keywords_at, seed=0):
+    # Writes the given number of synthetic notebooks under root, 100 per directory. Returns their filenames.
+
+    rng = random.Random(seed)
+    filenames = []
+    for n in range(notebooks):
+        path = os.path.join(root,'topic_%d' % (n//1000),'chapter_%d' % (n//100))
+        os.makedirs(path,exist_ok=True)
+        filename = os.path.join(path,'notebook_%d.ipynb' % n)
+        write_notebook(filename,make_notebook(rng,cells,image_size,keywords_at))
+        filenames.append(filename)
+    return filenames
+
+def run_indexer(root, jobs):
+    # Runs the indexer on root in a new process. Returns the wall time and CPU time in seconds, and the peak RSS in KiB.
+    # The resource usage is that of this process alone, as reported when it is reaped (including the CPU time of its
+    # workers, and the peak RSS of the largest of them and the indexer), so earlier runs do not affect it.
+
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, INDEXER, '--incremental', '--root', root, '--jobs', str(jobs)])
+    _, status, rusage = os.wait4(process.pid,0)
+    wall = time.perf_counter()-start
+    process.returncode = os.waitstatus_to_exitcode(status)
+    if process.returncode!=0:
+        raise RuntimeError('indexer.py exited with code %d' % process.returncode)
+    cpu = rusage.ru_utime + rusage.ru_stime
+    # ru_maxrss is in KiB on Linux, but in bytes on macOS
+    peak_rss = rusage.ru_maxrss//1024 if sys.platform=='darwin' else rusage.ru_maxrss
+    return wall, cpu, peak_rss
+
+def benchmark(notebooks, cells, image_size, keywords_at, changed, jobs, workdir):
+    # Returns the results of a cold and a warm run on a freshly generated tree.
+
+    root = tempfile.mkdtemp(prefix='indexer_bench_',dir=workdir)
+    try:
+        filenames = make_tree(root,notebooks,cells,image_size,keywords_at)
+        case = {'notebooks':notebooks, 'cells':cells, 'image_size':image_size, 'keywords_at':keywords_at, 'jobs':jobs}
+        results = []
+        wall, cpu, peak_rss = run_indexer(root,jobs)
+        results.append(dict(case, run='cold', parsed=notebooks, wall_s=wall, cpu_s=cpu, peak_rss_kib=peak_rss, files_per_s=notebooks/wall))
+
+        # change a few notebooks, making sure that their mtime is different even on filesystems with coarse timestamps
+        rng = random.Random(1)
+        touched = rng.sample(filenames,max(1,int(changed*notebooks)))
+        for filename in touched:
+            write_notebook(filename,make_notebook(rng,cells,image_size,keywords_at))
+            stat = os.stat(filename)
+            os.utime(filename,(stat.st_atime,stat.st_mtime+1))
+        wall, cpu, peak_rss = run_indexer(root,jobs)
+        results.append(dict(case, run='warm', parsed=len(touched), wall_s=wall, cpu_s=cpu, peak_rss_kib=peak_rss, files_per_s=notebooks/wall))
+        return results
+    finally:
+        shutil.rmtree(root)
+
+def case_key(result):
+    return tuple(result[key] for key in ['notebooks','cells','image_size','keywords_at','jobs','run'])
+
+def print_results(results, baseline=None):
+    # Prints a table of the results, with the ratio to the baseline's wall time and peak RSS where available.
+
+    old = {case_key(result):result for result in (baseline or [])}
+    print('%9s %7s %7s %4s %5s %9s %9s %10s %10s  %s' % ('notebooks','image','keyword','jobs','run','wall (s)','CPU (s)','RSS (KiB)',
+                                                          'files/s','vs baseline'))
+    for result in results:
+        line = '%9d %7d %7s %4d %5s %9.3f %9.3f %10d %10.0f' % (result['notebooks'],result['image_size'],result['keywords_at'],
+                                                              result['jobs'],result['run'],result['wall_s'],result['cpu_s'],
+                                                              result['peak_rss_kib'],result['files_per_s'])
+        before = old.get(case_key(result))
+        if before:
+            line += '  time x%.2f, RSS x%.2f' % (result['wall_s']/before['wall_s'], result['peak_rss_kib']/before['peak_rss_kib'])
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark indexer.py on synthetic notebook trees.')
+    parser.add_argument('--sizes', default='100,1000,10000',
+                        help='comma separated numbers of notebooks per tree (default: 100,1000,10000, up to 50000 is supported)')
+    parser.add_argument('--cells', type=int, default=20,
+                        help='number of cells per notebook, besides the keywords cell (default: 20)')
+    parser.add_argument('--image-sizes', default='0,20000',
+                        help='comma separated sizes in bytes of the PNG embedded in each code cell, 0 for none (default: 0,20000)')
+    parser.add_argument('--keywords-at', default='start,middle,end,none',
+                        help='comma separated positions of the keywords cell: start, middle, end or none (default: start,middle,end,none)')
+    parser.add_argument('--changed', type=float, default=0.01,
+                        help='fraction of notebooks changed before the warm run (default: 0.01)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='passed on to indexer.py (default: 1)')
+    parser.add_argument('--workdir', default=None,
+                        help='directory in which the synthetic trees are generated (default: system temporary directory)')
+    parser.add_argument('--output', default='indexer_benchmark.json',
+                        help='file to write the results to (default: indexer_benchmark.json)')
+    parser.add_argument('--compare', metavar='JSON',
+                        help='results of an earlier run to compare against')
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+
+    results = []
+    for notebooks in [int(n) for n in args.sizes.split(',')]:
+        for image_size in [int(n) for n in args.image_sizes.split(',')]:
+            for keywords_at in args.keywords_at.split(','):
+                print('Benchmarking %d notebooks, images of %d bytes, keywords at %s ...' % (notebooks,image_size,keywords_at))
+                results += benchmark(notebooks,args.cells,image_size,keywords_at,args.changed,args.jobs,args.workdir)
+
+    with open(args.output,'w') as file:
+        json.dump({'python':platform.python_version(), 'platform':platform.platform(), 'cpus':os.cpu_count(),
+                   'time':time.strftime('%Y-%m-%dT%H:%M:%S'), 'results':results}, file, indent=1)
+    print_results(results,baseline)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+# run this to move the images embedded in notebook outputs into a blob directory
+#
+# Large `image/png` and `image/svg+xml` outputs are written to
+# notebook_blobs/<first two hex digits>/<sha256>.png (or .svg), named by the
+# sha256 of the image, so that an image used by several notebooks is only
+# stored once. In the notebook, the image is removed from the output's data
+# and a reference to the blob is left in the output's metadata:
+#
+#     "metadata": {"externalized": {"image/png": {"sha256": "...", "size": 12345}}}
+#
+# The notebooks stay valid, and the rest of each output (such as its
+# text/plain representation) is kept. To render a notebook, rehydrate it,
+# which only reads the blobs that this notebook refers to:
+#
+#     python externalize_outputs.py                    # externalize all notebooks
+#     python externalize_outputs.py --rehydrate games/Hello_Qiskit.ipynb --output /tmp/Hello_Qiskit.ipynb
+#     python externalize_outputs.py --restore          # put all images back into the notebooks
+#     python externalize_outputs.py --prune            # delete blobs that no notebook refers to
+
+import os
+import sys
+import json
+import base64
+import hashlib
+import argparse
+
+from indexer import find_notebooks, write_atomic
+
+BLOBS = 'notebook_blobs'
+MIN_SIZE = 10*1024
+EXTENSIONS = {'image/png':'.png', 'image/svg+xml':'.svg'}
+
+def read_notebook(filename):
+    with open(filename,encoding='utf-8') as file:
+        return json.load(file)
+
+def dumps_notebook(notebook):
+    # The same layout as nbformat.write, so that the only changes in a diff are the moved outputs.
+
+    return json.dumps(notebook, indent=1, sort_keys=True, ensure_ascii=False, separators=(',',': '))+'\n'
+
+def blob_path(blobs, sha256, mime):
+    return os.path.join(blobs, sha256[:2], sha256+EXTENSIONS[mime])
+
+def encode_image(value, mime):
+    # Returns the bytes of the image stored in an output, and how to format them to get the output back.
+    # Returns None if the output could not be reproduced exactly from the bytes, in which case it is left alone.
+
+    if mime=='image/png':
+        if not isinstance(value,str):
+            return None
+        layout = {'newline':value.endswith('\n')}
+        try:
+            raw = base64.b64decode(value)
+        except ValueError:
+            return None
+    else:
+        layout = {'lines':isinstance(value,list)}
+        raw = ''.join(value).encode('utf-8')
+    if decode_image(raw,mime,layout)!=value:
+        return None
+    return raw, layout
+
+def decode_image(raw, mime, layout):
+    # Returns the value of an output for an image with the given bytes.
+
+    if mime=='image/png':
+        return base64.b64encode(raw).decode('ascii') + '\n'*layout.get('newline',False)
+    text = raw.decode('utf-8')
+    return text.splitlines(True) if layout.get('lines') else text
+
+def iter_outputs(notebook):
+    # Yields every output of the notebook's code cells.
+
+    for cell in notebook.get('cells',[]):
+        if cell.get('cell_type')=='code':
+            for output in cell.get('outputs',[]):
+                yield output
+
+def externalize(notebook, blobs, min_size=MIN_SIZE, dry_run=False):
+    # Moves the images of at least min_size encoded bytes out of the notebook. Returns the number of bytes moved.
+
+    moved = 0
+    for output in iter_outputs(notebook):
+        data = output.get('data',{})
+        for mime in EXTENSIONS:
+            value = data.get(mime)
+            if value is None or len(''.join(value))<min_size:
+                continue
+            encoded = encode_image(value,mime)
+            if encoded is None:
+                continue
+            raw, layout = encoded
+            sha256 = hashlib.sha256(raw).hexdigest()
+            filename = blob_path(blobs,sha256,mime)
+            if not dry_run and not os.path.exists(filename):
+                os.makedirs(os.path.dirname(filename),exist_ok=True)
+                tmp = filename+'.tmp'
+                with open(tmp,'wb') as file:
+                    file.write(raw)
+                os.replace(tmp,filename)
+            reference = dict(layout, sha256=sha256, size=len(raw))
+            output.setdefault('metadata',{}).setdefault('externalized',{})[mime] = reference
+            del data[mime]
+            moved += len(''.join(value))
+    return moved
+
+def rehydrate(notebook, blobs):
+    # Puts the externalized images back into the notebook. Only the blobs that it refers to are read.
+
+    for output in iter_outputs(notebook):
+        metadata = output.get('metadata',{})
+        references = metadata.pop('externalized',{})
+        for mime in references:
+            with open(blob_path(blobs,references[mime]['sha256'],mime),'rb') as file:
+                raw = file.read()
+            output.setdefault('data',{})[mime] = decode_image(raw,mime,references[mime])
+    return notebook
+
+def referenced_blobs(notebook, blobs):
+    # Yields the filenames of the blobs that the notebook refers to.
+
+    for output in iter_outputs(notebook):
+        references = output.get('metadata',{}).get('externalized',{})
+        for mime in references:
+            yield blob_path(blobs,references[mime]['sha256'],mime)
+
+def main():
+    parser = argparse.ArgumentParser(description='Move large images in notebook outputs into a content-addressed blob directory.')
+    parser.add_argument('--root', default=os.getcwd(),
+                        help='directory containing the notebooks (default: current directory)')
+    parser.add_argument('--blobs', default=None,
+                        help='blob directory (default: '+BLOBS+' under the root)')
+    parser.add_argument('--min-size', type=int, default=MIN_SIZE,
+                        help='only move images of at least this many encoded bytes (default: %d)' % MIN_SIZE)
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only report how much would be moved')
+    parser.add_argument('--rehydrate', metavar='NOTEBOOK',
+                        help='write a copy of NOTEBOOK with its images put back, to --output')
+    parser.add_argument('--output', default='-',
+                        help='with --rehydrate, the file to write to (default: standard output)')
+    parser.add_argument('--restore', action='store_true',
+                        help='put the images back into all notebooks')
+    parser.add_argument('--prune', action='store_true',
+                        help='delete blobs that no notebook refers to')
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    blobs = os.path.abspath(args.blobs or os.path.join(root,BLOBS))
+
+    if args.rehydrate:
+        text = dumps_notebook(rehydrate(read_notebook(args.rehydrate),blobs))
+        if args.output=='-':
+            sys.stdout.write(text)
+        else:
+            write_atomic(args.output,text)
+        return
+
+    if args.prune:
+        used = set()
+        for filename in find_notebooks(root):
+            used.update(referenced_blobs(read_notebook(filename),blobs))
+        removed = 0
+        for path, dirs, files in os.walk(blobs):
+            for file in files:
+                if os.path.join(path,file) not in used:
+                    os.remove(os.path.join(path,file))
+                    removed += 1
+        print('Removed %d unreferenced blobs' % removed)
+        return
+
+    total = 0
+    for filename in find_notebooks(root):
+        notebook = read_notebook(filename)
+        if args.restore:
+            before = dumps_notebook(notebook)
+            text = dumps_notebook(rehydrate(notebook,blobs))
+            if text!=before:
+                write_atomic(filename,text)
+                print('Restored '+os.path.relpath(filename,root))
+            continue
+        moved = externalize(notebook,blobs,args.min_size,args.dry_run)
+        if moved:
+            total += moved
+            print('%8d KiB  %s' % (moved//1024,os.path.relpath(filename,root)))
+            if not args.dry_run:
+                write_atomic(filename,dumps_notebook(notebook))
+    if not args.restore:
+        print('%s %d KiB of images' % ('Would move' if args.dry_run else 'Moved',total//1024))
+
+if __name__ == '__main__':
+    main()
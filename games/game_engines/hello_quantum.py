@@ -3,248 +3,495 @@ from qiskit import ClassicalRegister, QuantumRegister, QuantumCircuit
 from qiskit import execute
 
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Circle, Rectangle
-import copy
-from ipywidgets import widgets  
-from IPython.display import display, clear_output 
-
-class run_game():
-    # Implements a puzzle, which is defined by the given inputs.
+import functools
+import heapq
+import math
+import re
+import statistics
+
+# Pauli matrices, for calculating expectation values exactly.
+PAULIS = {'I':np.array([[1,0],[0,1]],dtype=complex),
+          'X':np.array([[0,1],[1,0]],dtype=complex),
+          'Y':np.array([[0,-1j],[1j,0]],dtype=complex),
+          'Z':np.array([[1,0],[0,-1]],dtype=complex)}
+
+# Single qubit gates supported in exact mode, as functions of the gate's parameters.
+SINGLE_QUBIT_GATES = {
+    'id':lambda: PAULIS['I'], 'iden':lambda: PAULIS['I'],
+    'x':lambda: PAULIS['X'], 'y':lambda: PAULIS['Y'], 'z':lambda: PAULIS['Z'],
+    'h':lambda: np.array([[1,1],[1,-1]],dtype=complex)/np.sqrt(2),
+    's':lambda: np.diag([1,1j]), 'sdg':lambda: np.diag([1,-1j]),
+    't':lambda: np.diag([1,np.exp(1j*np.pi/4)]), 'tdg':lambda: np.diag([1,np.exp(-1j*np.pi/4)]),
+    'rx':lambda theta: np.array([[np.cos(theta/2),-1j*np.sin(theta/2)],[-1j*np.sin(theta/2),np.cos(theta/2)]]),
+    'ry':lambda theta: np.array([[np.cos(theta/2),-np.sin(theta/2)],[np.sin(theta/2),np.cos(theta/2)]],dtype=complex),
+    'rz':lambda phi: np.diag([np.exp(-1j*phi/2),np.exp(1j*phi/2)]),
+    'u1':lambda lam: np.diag([1,np.exp(1j*lam)])
+}
+
+@functools.lru_cache(maxsize=None)
+def gate_matrix(name,qubits,params=()):
+    # Returns the 4x4 unitary of a gate acting on the given qubits (a tuple of 0 and 1, with the target last).
+    # The state vector is ordered as in Qiskit, so that qubit 0 is the least significant bit of the index.
+    # Each unitary is only calculated once, so the arguments must be hashable, and the result must not be modified.
+    
+    if name in SINGLE_QUBIT_GATES:
+        matrix = SINGLE_QUBIT_GATES[name](*params)
+        if qubits[0]==0:
+            return np.kron(PAULIS['I'],matrix)
+        else:
+            return np.kron(matrix,PAULIS['I'])
+    elif name in ['cx','cz','swap']:
+        matrix = np.zeros((4,4),dtype=complex)
+        for index in range(4):
+            bits = [(index>>j)&1 for j in range(2)]
+            phase = 1
+            if name=='cx' and bits[qubits[0]]:
+                bits[qubits[1]] = 1-bits[qubits[1]]
+            elif name=='cz' and bits[0] and bits[1]:
+                phase = -1
+            elif name=='swap':
+                bits = bits[::-1]
+            matrix[bits[0]+2*bits[1],index] = phase
+        return matrix
+    raise ValueError("The gate '"+name+"' is not supported in exact mode.")
+
+def apply_instruction(qc,instruction,state):
+    # Returns the state vector obtained by applying an instruction of the circuit qc to the given one.
+    # Barriers are ignored, and the circuit must not contain measurements.
+    
+    gate, qargs = instruction[0], instruction[1]
+    if gate.name=='barrier':
+        return state
+    # qubits are (register,index) tuples in older versions of Qiskit, and objects with an index in newer ones
+    qubits = tuple( qarg[1] if isinstance(qarg,tuple) else qc.find_bit(qarg).index for qarg in qargs )
+    return gate_matrix(gate.name,qubits,tuple(float(param) for param in gate.params)).dot(state)
+
+@functools.lru_cache(maxsize=None)
+def pauli_operator(pauli):
+    # Returns the 4x4 matrix of a two qubit Pauli, such as 'XI' (X on qubit 0). Each is only calculated once.
+    
+    return np.kron(PAULIS[pauli[1]],PAULIS[pauli[0]])
+
+def get_expectation(state,pauli):
+    # Returns the expectation value of a two qubit Pauli for the given state vector.
+    
+    return np.real( np.vdot( state, pauli_operator(pauli).dot(state) ) )
+
+# Gates used to rotate groups of Paulis to the Z basis for measurement, and their costs (two qubit gates are the noisiest on real devices).
+MEASUREMENT_GATES = [('h',(0,)),('h',(1,)),('s',(0,)),('s',(1,)),('sdg',(0,)),('sdg',(1,)),('cx',(0,1)),('cx',(1,0))]
+MEASUREMENT_COSTS = {'h':1,'s':1,'sdg':1,'cx':10}
+
+def commute(pauli_a,pauli_b):
+    # Returns whether two Paulis commute, which they do when they differ on an even number of qubits on which neither is 'I'.
+
+    return sum( a!='I' and b!='I' and a!=b for a, b in zip(pauli_a,pauli_b) )%2==0
+
+@functools.lru_cache(maxsize=None)
+def measurement_groups(paulis):
+    # Returns a partition of a tuple of Paulis into the fewest groups of Paulis that all commute, found by exhaustive search.
+    # Each group can be measured with a single circuit. Returns a list of all such partitions, as tuples of tuples.
+
+    best = [len(paulis)+1, []]
+    def search(j,groups):
+        if len(groups)>best[0]:
+            return
+        if j==len(paulis):
+            if len(groups)<best[0]:
+                best[:] = [len(groups), []]
+            best[1].append( tuple(tuple(group) for group in groups) )
+            return
+        for group in groups:
+            if all(commute(paulis[j],pauli) for pauli in group):
+                group.append(paulis[j])
+                search(j+1,groups)
+                group.pop()
+        groups.append([paulis[j]])
+        search(j+1,groups)
+        groups.pop()
+    search(0,[])
+    return best[1]
+
+def z_readout(matrix):
+    # Returns how a Pauli whose 4x4 matrix is given can be read from the outputs of measuring both qubits, as a sign and a tuple of qubits whose parity
+    # gives the outcome. Returns None if the matrix is not diagonal, in which case it cannot be read.
+
+    if np.abs(matrix-np.diag(np.diag(matrix))).max()>1e-6:
+        return None
+    diagonal = np.real(np.diag(matrix))
+    return int(np.sign(diagonal[0])), tuple( j for j in range(2) if diagonal[2**j]*diagonal[0]<0 )
+
+@functools.lru_cache(maxsize=None)
+def conjugate_pauli(gate,pauli):
+    # Returns the Pauli that a gate from MEASUREMENT_GATES maps the given one to by conjugation, as a sign and a Pauli.
+
+    unitary = gate_matrix(*gate)
+    matrix = unitary.dot(pauli_operator(pauli)).dot(unitary.conj().T)
+    for image in [a+b for a in 'IXYZ' for b in 'IXYZ']:
+        overlap = np.real(np.trace(pauli_operator(image).dot(matrix)))/4
+        if abs(abs(overlap)-1)<1e-6:
+            return int(np.sign(overlap)), image
+
+@functools.lru_cache(maxsize=None)
+def measurement_gates(group):
+    # Returns the cheapest list of gates from MEASUREMENT_GATES after which all Paulis in a group of commuting Paulis can be read from measurements in
+    # the Z basis, and the total cost of the gates. This is found by a uniform cost search over the Paulis that the group is mapped to.
+
+    queue = [(0,0,[],tuple((1,pauli) for pauli in group))]
+    seen = set()
+    count = 0
+    while queue:
+        cost, _, gates, images = heapq.heappop(queue)
+        if images in seen:
+            continue
+        seen.add(images)
+        if all( set(pauli)<=set('IZ') for sign, pauli in images ):
+            return gates, cost
+        for gate in MEASUREMENT_GATES:
+            count += 1
+            next_images = tuple( (sign*conjugate_pauli(gate,pauli)[0],conjugate_pauli(gate,pauli)[1]) for sign, pauli in images )
+            heapq.heappush(queue, (cost+MEASUREMENT_COSTS[gate[0]], count, gates+[gate], next_images) )
+    raise ValueError('The Paulis '+str(group)+' cannot be measured together.')
+
+@functools.lru_cache(maxsize=None)
+def measurement_plan(paulis):
+    # Returns the measurements needed to find the expectation values of a tuple of Paulis with the fewest circuits, and the cheapest gates among those.
+    # Each measurement is a tuple of the gates applied before measuring both qubits, and a dict with the sign and qubits to read each Pauli from its
+    # outputs. This includes all the Paulis that can be read, not only those of the group that it was made for, so that these can be averaged.
+    # For example, without the Y boxes, ZI, IX and ZX are read after an h on qubit 1, XI, IZ and XZ after an h on qubit 0, and ZZ and XX after a
+    # cx(0,1) and an h on qubit 0. With them, YY is read along with ZZ and XX.
+
+    plans = []
+    for groups in measurement_groups(paulis):
+        measurements = [measurement_gates(group) for group in groups]
+        plans.append( (sum(cost for gates, cost in measurements), [gates for gates, cost in measurements]) )
+    cost, all_gates = min(plans,key=lambda plan: plan[0])
+
+    plan = []
+    for gates in all_gates:
+        unitary = np.identity(4,dtype=complex)
+        for gate in gates:
+            unitary = gate_matrix(*gate).dot(unitary)
+        readout = {}
+        for pauli in paulis:
+            read = z_readout(unitary.dot(pauli_operator(pauli)).dot(unitary.conj().T))
+            if read:
+                readout[pauli] = read
+        plan.append( (tuple(gates),readout) )
+    return tuple(plan)
+
+def move_operation(gate,qubit):
+    # Returns the operation applied by a move of the game, as a gate name, a tuple of qubits (target last) and a tuple of parameters.
+    # The qubit is '0', '1' or 'both', as in allowed_gates. Returns None for moves that only change the visualization.
+    
+    gate = {'NOT':'x','CNOT':'cx'}.get(gate,gate)
+    if gate in ['bloch','unbloch']:
+        return None
+    q = 1 if qubit=='both' else int(qubit)
+    if gate in ['x','y','z','h']:
+        return (gate,(q,),())
+    elif gate in ['ry(pi/4)','ry(-pi/4)','rx(pi/4)','rx(-pi/4)']:
+        return (gate[:2],(q,),((-1)**('-' in gate)*np.pi/4,))
+    elif gate in ['cz','cx','swap']:
+        return (gate,(1-q,q),())
+    raise ValueError("The gate '"+gate+"' is not supported.")
+
+# Gates that can be used in the puzzles, in the order of their codes in compiled programs.
+GATES = ('x','y','z','h','ry(pi/4)','ry(-pi/4)','rx(pi/4)','rx(-pi/4)','cz','cx','swap')
+GATE_CODES = {gate:code for code, gate in enumerate(GATES)}
+
+def compile_program(moves):
+    # Returns the compiled program for a list of (gate,qubit) moves: an array of uint8 with a (gate code, target qubit) row for each.
+    # Moves that only change the visualization are left out.
+
+    program = []
+    for gate, qubit in moves:
+        gate = {'NOT':'x','CNOT':'cx'}.get(gate,gate)
+        if gate in ['bloch','unbloch']:
+            continue
+        if gate not in GATE_CODES:
+            raise ValueError("The gate '"+gate+"' is not supported.")
+        program.append( (GATE_CODES[gate], 1 if qubit=='both' else int(qubit)) )
+    return np.array(program,dtype=np.uint8).reshape(-1,2)
+
+def program_bytes(program):
+    # Returns a compiled program serialized as two bytes per operation.
+
+    return np.asarray(program,dtype=np.uint8).tobytes()
+
+def load_program(data):
+    # Returns the compiled program serialized by program_bytes.
+
+    return np.frombuffer(data,dtype=np.uint8).reshape(-1,2)
+
+@functools.lru_cache(maxsize=None)
+def program_operation(code,qubit):
+    # Returns the operation for a row of a compiled program, as a gate name, a tuple of qubits (target last) and a tuple of parameters.
+
+    return move_operation(GATES[code],str(qubit))
+
+@functools.lru_cache(maxsize=None)
+def program_unitaries():
+    # Returns the 4x4 unitaries of all rows of compiled programs, as an array indexed by gate code and target qubit.
+
+    return np.array([[gate_matrix(*program_operation(code,qubit)) for qubit in range(2)] for code in range(len(GATES))])
+
+def apply_program(program,qc,qubits):
+    # Adds the gates of a compiled program to the circuit qc, for which qubits are the two qubits (such as a QuantumRegister).
+
+    for code, qubit in np.asarray(program,dtype=np.uint8).reshape(-1,2).tolist():
+        name, targets, params = program_operation(code,qubit)
+        getattr(qc,name)(*params,*[qubits[j] for j in targets])
+    return qc
+
+def run_program(program,state=None):
+    # Returns the state vector obtained by applying a compiled program to the given one (00 by default).
+
+    if state is None:
+        state = np.array([1,0,0,0],dtype=complex)
+    unitaries = program_unitaries()
+    for code, qubit in np.asarray(program,dtype=np.uint8).reshape(-1,2).tolist():
+        state = unitaries[code,qubit].dot(state)
+    return state
+
+def run_programs(programs,states=None):
+    # Returns the final state vectors of many compiled programs, as an array with a row for each, starting from the given states (00 by default).
+    # The programs are run together, with one batched matrix multiplication for each step.
+
+    programs = [np.asarray(program,dtype=np.uint8).reshape(-1,2) for program in programs]
+    if states is None:
+        states = np.zeros((len(programs),4),dtype=complex)
+        states[:,0] = 1
+    else:
+        states = np.array(states,dtype=complex).reshape(len(programs),4)
+    lengths = np.array([len(program) for program in programs],dtype=int)
+    if not len(programs) or not lengths.max():
+        return states
+    # the programs padded to the same length, with the steps after the end of each masked out
+    steps = np.zeros((len(programs),lengths.max(),2),dtype=np.uint8)
+    for j, program in enumerate(programs):
+        steps[j,:len(program)] = program
+    unitaries = program_unitaries()
+    for step in range(lengths.max()):
+        running = np.flatnonzero(lengths>step)
+        codes = steps[running,step]
+        states[running] = np.einsum('nij,nj->ni',unitaries[codes[:,0],codes[:,1]],states[running])
+    return states
+
+def program_text(program,qubit_names={'0':'q[0]','1':'q[1]'}):
+    # Returns the lines of Qiskit code for a compiled program, with the given names for the qubits.
+
+    lines = []
+    for code, qubit in np.asarray(program,dtype=np.uint8).reshape(-1,2).tolist():
+        gate = GATES[code]
+        qubit_name, other_name = qubit_names[str(qubit)], qubit_names[str(1-qubit)]
+        if gate in ['x','y','z','h']:
+            lines.append( 'qc.'+gate+'('+qubit_name+')' )
+        elif gate in ['cz','cx','swap']:
+            lines.append( 'qc.'+gate+'('+other_name+','+qubit_name+')' )
+        else:
+            lines.append( 'qc.'+gate[:2]+'('+'-'*('-' in gate)+'np.pi/4,'+qubit_name+')' )
+    return lines
+
+# A line of Qiskit code as given by program_text, with the optional sign of the angle, the control qubit and the target qubit in its groups.
+PROGRAM_LINE = re.compile(r'qc\.(\w+)\((-?)(?:np\.pi/4,)?(?:\w+\[([01])\],)?\w+\[([01])\]\)$')
+
+def parse_program(lines):
+    # Returns the compiled program for lines of Qiskit code, such as those recorded in puzzle.program by older versions of run_game, which
+    # have no puzzle.operations. The lines are parsed rather than evaluated.
+    
+    moves = []
+    for line in lines:
+        match = PROGRAM_LINE.match(line.strip())
+        if match is None:
+            raise ValueError("The line '"+line+"' is not a supported gate.")
+        gate, sign, control, target = match.groups()
+        if gate in ['rx','ry']:
+            gate += '('+sign+'pi/4)'
+        moves.append( (gate,target) )
+    return compile_program(moves)
+
+def state_keys(states):
+    # Returns a hashable key for each row of an array of state vectors, which is the same for states that differ only by a global phase.
     
-    def __init__(self,initialize, success_condition, allowed_gates, vi, qubit_names, eps=0.1, backend=Aer.get_backend('qasm_simulator'), shots=1024,mode='circle',verbose=False):
+    first = states[np.arange(len(states)),np.argmax(np.abs(states)>1e-6,axis=1)]
+    states = states*(np.abs(first)/first)[:,None]
+    rounded = np.round(np.concatenate([states.real,states.imag],axis=1),6)+0.0
+    return [row.tobytes() for row in rounded]
+
+class state_graph():
+    # The states reachable with a set of moves, and the transitions between them. Transitions are only calculated once.
+    
+    def __init__(self,moves):
         """
-        initialize
-            List of gates applied to the initial 00 state to get the starting state of the puzzle.
-            Supported single qubit gates (applied to qubit '0' or '1') are 'x', 'y', 'z', 'h', 'ry(pi/4)'.
-            Supported two qubit gates are 'cz' and 'cx'. Specify only the target qubit.
-        success_condition
-            Values for pauli observables that must be obtained for the puzzle to declare success.
-        allowed_gates
-            For each qubit, specify which operations are allowed in this puzzle. 'both' should be used only for operations that don't need a qubit to be specified ('cz' and 'unbloch').
-            Gates are expressed as a dict with an int as value. If this is non-zero, it specifies the number of times the gate is must be used (no more or less) for the puzzle to be successfully solved. If the value is zero, the player can use the gate any number of times. 
-        vi
-            Some visualization information as a three element list. These specify:
-            * which qubits are hidden (empty list if both shown).
-            * whether both circles shown for each qubit (use True for qubit puzzles and False for bit puzzles).
-            * whether the correlation circles (the four in the middle) are shown.
-        qubit_names
-            The two qubits are always called '0' and '1' from the programming side. But for the player, we can display different names.
-        eps=0.1
-            How close the expectation values need to be to the targets for success to be declared.
-        backend=Aer.get_backend('qasm_simulator')
-            Backend to be used by Qiskit to calculate expectation values (defaults to local simulator).
-        shots=1024
-            Number of shots used to to calculate expectation values.
-        mode='circle'
-            Either the standard 'Hello Quantum' visualization can be used (with mode='circle'), or the extended one (mode='y') or the alternative line based one (mode='line').
-        y_boxes = False
-            Whether to show expectation values involving y.
-        verbose=False     
+        moves
+            List of (gate,qubit) moves, with the gates and qubits as in allowed_gates.
         """
+        self.moves = list(moves)
+        # the unitary of each move, so that all moves can be applied to a state at once
+        self.unitaries = np.array([ np.eye(4) if operation is None else gate_matrix(*operation)
+                                    for operation in [move_operation(gate,qubit) for gate, qubit in self.moves] ])
+        self.states = {}
+        self.edges = {}
+    
+    def add(self,state):
+        # Adds a state vector to the graph, and returns its key.
+        
+        key = state_keys(state[None,:])[0]
+        self.states.setdefault(key,state)
+        return key
+    
+    def successors(self,key):
+        # Returns the key of the state reached by each move from the given one.
+        
+        if key not in self.edges:
+            next_states = self.unitaries.dot(self.states[key])
+            self.edges[key] = state_keys(next_states)
+            for next_key, state in zip(self.edges[key],next_states):
+                self.states.setdefault(next_key,state)
+        return self.edges[key]
+    
+    def explore(self,state,max_states=100000):
+        # Calculates all transitions between the states reachable from the given one. Returns the number of states.
+        # Raises a ValueError if there are more than max_states, which is the case for gate sets that can make infinitely many states.
+        
+        queue = [self.add(state)]
+        seen = set(queue)
+        while queue:
+            for next_key in self.successors(queue.pop()):
+                if next_key not in seen:
+                    if len(seen)>=max_states:
+                        raise ValueError('More than '+str(max_states)+' states can be reached.')
+                    seen.add(next_key)
+                    queue.append(next_key)
+        return len(seen)
 
-        def get_total_gate_list():
-            # Get a text block describing allowed gates.
-            
-            total_gate_list = ""
-            for qubit in allowed_gates:
-                gate_list = ""
-                for gate in allowed_gates[qubit]:
-                    if required_gates[qubit][gate] > 0 :
-                        gate_list += '  ' + gate+" (use "+str(required_gates[qubit][gate])+" time"+"s"*(required_gates[qubit][gate]>1)+")"
-                    elif allowed_gates[qubit][gate]==0:
-                        gate_list += '  '+gate + ' '
-                if gate_list!="":
-                    if qubit=="both" :
-                        gate_list = "\nAllowed symmetric operations:" + gate_list
-                    else :
-                        gate_list = "\nAllowed operations for " + qubit_names[qubit] + ":\n" + " "*10 + gate_list
-                    total_gate_list += gate_list +"\n"
-            return total_gate_list
-
-        def get_success(required_gates):
-            # Determine whether the success conditions are satisfied, both for expectation values, and the number of gates to be used.
-            
-            success = True
-            grid.get_rho()
-            if verbose:
-                print(grid.rho)
-            for pauli in success_condition:
-                success = success and (abs(success_condition[pauli] - grid.rho[pauli])<eps)
-            for qubit in required_gates:
-                for gate in required_gates[qubit]:
-                    success = success and (required_gates[qubit][gate]==0)
-            return success
+@functools.lru_cache(maxsize=None)
+def get_state_graph(moves):
+    # Returns the state graph for the given tuple of moves. There is only one for each set of moves, shared by all puzzles using it.
+    
+    return state_graph(moves)
+
+def puzzle_moves(allowed_gates):
+    # Returns the (gate,qubit) moves allowed in a puzzle, and the number of times each must still be used.
+    
+    moves = tuple( (gate,qubit) for qubit in ['0','1','both'] for gate in sorted(allowed_gates[qubit]) )
+    required = tuple( allowed_gates[qubit][gate] for gate, qubit in moves )
+    return moves, required
+
+def is_solved(state,success_condition,required,tolerance=1e-3):
+    # Returns whether a state meets the success condition of a puzzle, when the given numbers of uses are still required.
+    
+    for pauli in success_condition:
+        if abs(success_condition[pauli]-get_expectation(state,pauli))>=tolerance:
+            return False
+    return not any(required)
+
+def initial_state(initialize):
+    # Returns the state vector at the start of a puzzle.
+    
+    state = np.array([1,0,0,0],dtype=complex)
+    for gate, qubit in initialize:
+        state = gate_matrix(*move_operation(gate,qubit)).dot(state)
+    return state
+
+def solve(initialize,success_condition,allowed_gates,state=None,max_moves=50,tolerance=1e-3,max_states=100000):
+    """
+    Finds a shortest solution of a puzzle with a breadth first search of its state graph.
+    The arguments are as for run_game. As in the game, a solution must use each gate with a non-zero number in allowed_gates at least that
+    many times: once its uses have all been made, it can be used freely, like the gates with zero.
+    
+    state=None
+        State vector to start from, instead of the one made by initialize. In this case, allowed_gates should give the uses still required.
+    max_moves=50
+        Length of the longest solution searched for.
+    tolerance=1e-3
+        How close the expectation values need to be to the targets.
+    max_states=100000
+        Number of states (with the uses still required) after which the search is abandoned with a ValueError.
         
-        def show_circuit():
-            gates = get_total_gate_list
+    Returns a list of (gate,qubit) moves, or None if there is no solution.
+    """
+    
+    moves, required = puzzle_moves(allowed_gates)
+    graph = get_state_graph(moves)
+    if state is None:
+        state = initial_state(initialize)
+    start = (graph.add(state),required)
+    
+    parents = {start:None}
+    level = [start]
+    for depth in range(max_moves+1):
+        next_level = []
+        for node in level:
+            key, counts = node
+            if is_solved(graph.states[key],success_condition,counts,tolerance):
+                solution = []
+                while parents[node] is not None:
+                    node, move = parents[node]
+                    solution.append(moves[move])
+                return solution[::-1]
+            for move, next_key in enumerate(graph.successors(key)):
+                next_counts = counts
+                if counts[move]>0:
+                    next_counts = counts[:move] + (counts[move]-1,) + counts[move+1:]
+                next_node = (next_key,next_counts)
+                if next_node not in parents:
+                    if len(parents)>=max_states:
+                        raise ValueError('More than '+str(max_states)+' states were searched.')
+                    parents[next_node] = (node,move)
+                    next_level.append(next_node)
+        level = next_level
+    return None
 
-        def get_command(gate,qubit):
-            # For a given gate and qubit, return the string describing the corresoinding Qiskit string.
-            
-            if qubit=='both':
-                qubit = '1'
-            qubit_name = qubit_names[qubit]
-            for name in qubit_names.values():
-                if name!=qubit_name:
-                    other_name = name
-            # then make the command (both for the grid, and for printing to screen)    
-            if gate in ['x','y','z','h']:
-                real_command  = 'grid.qc.'+gate+'(grid.qr['+qubit+'])'
-                clean_command = 'qc.'+gate+'('+qubit_name+')'
-            elif gate in ['ry(pi/4)','ry(-pi/4)']:
-                real_command  = 'grid.qc.ry('+'-'*(gate=='ry(-pi/4)')+'np.pi/4,grid.qr['+qubit+'])'
-                clean_command = 'qc.ry('+'-'*(gate=='ry(-pi/4)')+'np.pi/4,'+qubit_name+')'
-            elif gate in ['rx(pi/4)','rx(-pi/4)']:
-                real_command  = 'grid.qc.rx('+'-'*(gate=='rx(-pi/4)')+'np.pi/4,grid.qr['+qubit+'])'
-                clean_command = 'qc.rx('+'-'*(gate=='rx(-pi/4)')+'np.pi/4,'+qubit_name+')'
-            elif gate in ['cz','cx','swap']: 
-                real_command  = 'grid.qc.'+gate+'(grid.qr['+'0'*(qubit=='1')+'1'*(qubit=='0')+'],grid.qr['+qubit+'])'
-                clean_command = 'qc.'+gate+'('+other_name+','+qubit_name+')'
-            return [real_command,clean_command]
-
-        clear_output()
-        bloch = [None]
-
-        # set up initial state and figure
-        if mode=='y':
-            grid = pauli_grid(backend=backend,shots=shots,mode='circle',y_boxes=True)
-        else:
-            grid = pauli_grid(backend=backend,shots=shots,mode=mode)
-        for gate in initialize:
-            eval( get_command(gate[0],gate[1])[0] )
-
-        required_gates = copy.deepcopy(allowed_gates)
-
-        # determine which qubits to show in figure
-        if allowed_gates['0']=={} : # if no gates are allowed for qubit 0, we know to only show qubit 1
-                shown_qubit = 1
-        elif allowed_gates['1']=={} : # and vice versa
-                shown_qubit = 0
-        else :
-                shown_qubit = 2
-
-        # show figure
-        grid.update_grid(bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list())
-
-
-        description = {'gate':['Choose gate'],'qubit':['Choose '+'qu'*vi[1]+'bit'],'action':['Make it happen!']}
-
-        all_allowed_gates_raw = []
-        for q in ['0','1','both']:
-            all_allowed_gates_raw += list(allowed_gates[q])
-        all_allowed_gates_raw = list(set(all_allowed_gates_raw))
-
-        all_allowed_gates = []
-        for g in ['bloch','unbloch']:
-            if g in all_allowed_gates_raw:
-                all_allowed_gates.append( g )
-        for g in ['x','y','z','h','cz','cx']:
-            if g in all_allowed_gates_raw:
-                all_allowed_gates.append( g )
-        for g in all_allowed_gates_raw:
-            if g not in all_allowed_gates:
-                all_allowed_gates.append( g )
-
-        gate = widgets.ToggleButtons(options=description['gate']+all_allowed_gates)
-        qubit = widgets.ToggleButtons(options=[''])
-        action = widgets.ToggleButtons(options=[''])
-
-        boxes = widgets.VBox([gate,qubit,action])
-        display(boxes)
-        if qubit_names=={'0':'q[0]', '1':'q[1]'}:
-            print('\nYour quantum program so far:\n\n    q = QuantumRegister(2)\n    b = ClassicalRegister(2)\n    qc = QuantumCircuit(q,b)\n')
-        self.program = []
-
-        def given_gate(a):
-            # Action to be taken when gate is chosen. This sets up the system to choose a qubit.
-            
-            if gate.value:
-                if gate.value in allowed_gates['both']:
-                    qubit.options = description['qubit'] + ["not required"]
-                    qubit.value = "not required"
-                else:
-                    allowed_qubits = []
-                    for q in ['0','1']:
-                        if (gate.value in allowed_gates[q]) or (gate.value in allowed_gates['both']):
-                            allowed_qubits.append(q)
-                    allowed_qubit_names = []
-                    for q in allowed_qubits:
-                        allowed_qubit_names += [qubit_names[q]]
-                    qubit.options = description['qubit'] + allowed_qubit_names
-
-        def given_qubit(b):
-            # Action to be taken when qubit is chosen. This sets up the system to choose an action.
-            
-            if qubit.value not in ['',description['qubit'][0],'Success!']:
-                action.options = description['action']+['Apply operation']
-                
-        def given_action(c):
-            # Action to be taken when user confirms their choice of gate and qubit.
-            # This applied the command, updates the visualization and checks whether the puzzle is solved.
-            
-            if action.value not in ['',description['action'][0]]:
-                # apply operation
-                if action.value=='Apply operation':
-                    if qubit.value not in ['',description['qubit'][0],'Success!']:
-                        # translate bit gates to qubit gates
-                        if gate.value=='NOT':
-                            q_gate = 'x'
-                        elif gate.value=='CNOT':
-                            q_gate = 'cx'
-                        else:
-                            q_gate = gate.value
-                        if qubit.value=="not required":
-                            q = qubit_names['1']
-                        else:
-                            q = qubit.value
-                        q01 = '0'*(qubit.value==qubit_names['0']) + '1'*(qubit.value==qubit_names['1']) + 'both'*(qubit.value=="not required")     
-                        if q_gate in ['bloch','unbloch']:
-                            if q_gate=='bloch':
-                                bloch[0] = q01
-                            else:
-                                bloch[0] = None
-                        else:
-                            command = get_command(q_gate,q01)
-                            eval(command[0])
-                            if qubit_names in [{'0':'q[0]', '1':'q[1]'},{'0':'A', '1':'B'}]:
-                                print('    ' + command[1])
-                            self.program.append( command[1] )
-                        if required_gates[q01][gate.value]>0:
-                            required_gates[q01][gate.value] -= 1
-
-                        grid.update_grid(bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list())
-
-                success = get_success(required_gates)
-                if success:
-                    gate.options = ['Success!']
-                    qubit.options = ['Success!']
-                    action.options = ['Success!']
-                    plt.close(grid.fig)
-                else:
-                    gate.value = description['gate'][0]  
-                    qubit.options = ['']
-                    action.options = ['']  
-
-        gate.observe(given_gate)
-        qubit.observe(given_qubit)
-        action.observe(given_action)
+def validate_puzzles(puzzles,max_moves=50):
+    """
+    Solves many puzzles, to check that they can be solved.
+    
+    puzzles
+        List of dicts with the 'initialize', 'success_condition' and 'allowed_gates' of each puzzle, as for run_game.
         
+    Returns a list with a shortest solution for each puzzle, None for those without a solution, or the error raised by those that are invalid.
+    """
+    
+    solutions = []
+    for puzzle in puzzles:
+        try:
+            solutions.append( solve(puzzle['initialize'],puzzle['success_condition'],puzzle['allowed_gates'],max_moves=max_moves) )
+        except (ValueError,KeyError) as error:
+            solutions.append(error)
+    return solutions
+
+def _display():
+    # Returns the rendering layer, which needs matplotlib and ipywidgets, and so is only imported when first used.
+    
+    try:
+        from . import hello_quantum_display
+    except ImportError:
+        import hello_quantum_display
+    return hello_quantum_display
+
+def __getattr__(name):
+    # run_game is implemented in the rendering layer, but can still be used as hello_quantum.run_game.
+    
+    if name=='run_game':
+        return _display().run_game
+    raise AttributeError("module '"+__name__+"' has no attribute '"+name+"'")
+
 def get_circuit(puzzle):
     
     q = QuantumRegister(2,'q')
     b = ClassicalRegister(2,'b')
     qc = QuantumCircuit(q,b)
-    
-    for line in puzzle.program:
-        eval(line)
-        
-    return qc
+
+    operations = getattr(puzzle,'operations',None)
+    if operations is None:
+        operations = parse_program(puzzle.program)
+    return apply_program(operations,qc,q)
 
 class pauli_grid():
     # Allows a quantum circuit to be created, modified and implemented, and visualizes the output in the style of 'Hello Quantum'.
 
-    def __init__(self,backend=Aer.get_backend('qasm_simulator'),shots=1024,mode='circle',y_boxes=False):
+    def __init__(self,backend=Aer.get_backend('qasm_simulator'),shots=1024,mode='circle',y_boxes=False,exact=False):
         """
         backend=Aer.get_backend('qasm_simulator')
             Backend to be used by Qiskit to calculate expectation values (defaults to local simulator).
@@ -254,10 +501,13 @@ class pauli_grid():
             Either the standard 'Hello Quantum' visualization can be used (with mode='circle') or the alternative line based one (mode='line').
         y_boxes=True
             Whether to display full grid that includes Y expectation values.
+        exact=False
+            Whether to calculate the expectation values exactly from the state vector with NumPy, instead of sampling them with the backend.
         """
         
         self.backend = backend
         self.shots = shots
+        self.exact = exact
         
         self.y_boxes = y_boxes
         if self.y_boxes:
@@ -275,6 +525,12 @@ class pauli_grid():
         self.qr = QuantumRegister(2)
         self.cr = ClassicalRegister(2)
         self.qc = QuantumCircuit(self.qr, self.cr)
+        self.measurements = {}
+        # stacks of the state vectors after each instruction of self.qc, for exact mode, and of the expectation values sampled after each
+        # (None where they were not sampled), for sampling mode
+        self.states = [np.array([1,0,0,0],dtype=complex)]
+        self.sampled = [None]
+        self.states_qc = self.qc
         
         self.mode = mode
         # colors are background, qubit circles and correlation circles, respectively
@@ -283,72 +539,176 @@ class pauli_grid():
         else:
             self.colors = [(1.6/255,72/255,138/255),(132/255,177/255,236/255),(33/255,114/255,216/255)]
         
-        self.fig = plt.figure(figsize=(5,5),facecolor=self.colors[0])
-        self.ax = self.fig.add_subplot(111)
-        plt.axis('off')
+        # the figure is only created when the grid is first drawn, so that no display is needed to use the grid
+        self.fig = None
+
+
+    def trim_stacks(self):
+        # Removes the entries of the stacks for instructions that are no longer in self.qc.
+        # This assumes that instructions are only added to the end of self.qc, or removed with undo().
         
-        self.bottom = self.ax.text(-3,1,"",size=9,va='top',color='w')
+        if self.states_qc is not self.qc:
+            # the circuit was replaced
+            self.states = self.states[:1]
+            self.sampled = [None]
+            self.states_qc = self.qc
+        del self.states[len(self.qc.data)+1:]
+        del self.sampled[len(self.qc.data)+1:]
+
+    def get_state(self):
+        # Returns the state vector prepared by self.qc, calculated with NumPy.
+        # Only the instructions added to self.qc since the last call are applied, to the top of the stack of states.
         
-        self.lines = {}
-        for pauli in self.box:
-            w = plt.plot( [self.box[pauli][0],self.box[pauli][0]], [self.box[pauli][1],self.box[pauli][1]], color=(1.0,1.0,1.0), lw=0 )
-            b = plt.plot( [self.box[pauli][0],self.box[pauli][0]], [self.box[pauli][1],self.box[pauli][1]], color=(0.0,0.0,0.0), lw=0 )
-            c = {}
-            c['w'] = self.ax.add_patch( Circle(self.box[pauli], 0.0, color=(0,0,0), zorder=10) )
-            c['b'] = self.ax.add_patch( Circle(self.box[pauli], 0.0, color=(1,1,1), zorder=10) )
-            self.lines[pauli] = {'w':w,'b':b,'c':c}
-                         
-    
-    def get_rho(self):
-        # Runs the circuit specified by self.qc and determines the expectation values for 'ZI', 'IZ', 'ZZ', 'XI', 'IX', 'XX', 'ZX' and 'XZ' (and the ones with Ys too if needed).
+        self.trim_stacks()
+        data = self.qc.data
+        for instruction in data[len(self.states)-1:]:
+            self.states.append( apply_instruction(self.qc,instruction,self.states[-1]) )
+        return self.states[-1]
+
+    def undo(self):
+        # Removes the last instruction from self.qc. The previous state (in exact mode) or the expectation values sampled for it (in sampling
+        # mode) are then taken from the stacks, so no new job is needed to show them.
         
-        if self.y_boxes:
-            corr = ['ZZ','ZX','XZ','XX','YY','YX','YZ','XY','ZY']
-            ps = ['X','Y','Z']
+        self.qc.data.pop()
+        self.trim_stacks()
+
+    def get_measurement(self,gates):
+        # Returns a circuit that applies the given gates from a measurement plan and measures both qubits, to be appended to self.qc.
+        # These are only made once for each measurement.
+
+        if gates not in self.measurements:
+            meas_qc = QuantumCircuit(self.qr, self.cr)
+            for name, qubits in gates:
+                getattr(meas_qc,name)(*[self.qr[j] for j in qubits])
+            meas_qc.barrier(self.qr)
+            meas_qc.measure(self.qr,self.cr)
+            self.measurements[gates] = meas_qc
+        return self.measurements[gates]
+
+    def get_plan(self):
+        # Returns the measurement plan for the expectation values in self.rho: the fewest measurements from which they can all be read.
+        
+        return measurement_plan(tuple(self.rho))
+
+    def get_circuits(self):
+        # Returns the circuits that are run to sample the expectation values: self.qc followed by each measurement of the plan.
+        
+        # newer versions of Qiskit combine circuits with compose, rather than +
+        if hasattr(self.qc,'compose'):
+            return [self.qc.compose(self.get_measurement(gates)) for gates, readout in self.get_plan()]
         else:
-            corr = ['ZZ','ZX','XZ','XX']
-            ps = ['X','Z']
+            return [self.qc + self.get_measurement(gates) for gates, readout in self.get_plan()]
+
+    def get_tallies(self,counts):
+        # Returns the number of samples of each expectation value in a list of the counts for the circuits from get_circuits, and the number of these
+        # that gave the value -1. Expectation values that can be read from several of the circuits are sampled by all of them.
         
-        results = {}
-        for basis in corr:
-            temp_qc = copy.deepcopy(self.qc)
-            for j in range(2):
-                if basis[j]=='X':
-                    temp_qc.h(self.qr[j])
-                elif basis[j]=='Y':
-                    temp_qc.sdg(self.qr[j])
-                    temp_qc.h(self.qr[j])
-            temp_qc.barrier(self.qr)
-            temp_qc.measure(self.qr,self.cr)
-            job = execute(temp_qc, backend=self.backend, shots=self.shots)
-            results[basis] = job.result().get_counts()
-            for string in results[basis]:
-                results[basis][string] = results[basis][string]/self.shots
-
-        prob = {}
-        # prob of expectation value -1 for single qubit observables
-        for j in range(2):
-            
-            for p in ps:
-                pauli = {}
-                for pp in ['I']+ps:
-                    pauli[pp] = (j==1)*pp + p + (j==0)*pp
-                prob[pauli['I']] = 0
-                for ppp in ps:
-                    basis = pauli[ppp]
-                    for string in results[basis]:
-                        if string[(j+1)%2]=='1':
-                            prob[pauli['I']] += results[basis][string]/(2+self.y_boxes)
+        samples = {pauli:0 for pauli in self.rho}
+        minus = {pauli:0 for pauli in self.rho}
+        for j, (gates, readout) in enumerate(self.get_plan()):
+            for pauli in readout:
+                sign, qubits = readout[pauli]
+                # the value is given by the parity of the bits for the qubits (whose bits are in reverse order in the strings)
+                for string in counts[j]:
+                    parity = sum( string[1-k]=='1' for k in qubits )%2
+                    if sign*(1-2*parity)==-1:
+                        minus[pauli] += counts[j][string]
+                samples[pauli] += sum(counts[j].values())
+        return samples, minus
+
+    def set_rho(self,counts):
+        # Sets the expectation values from a list of the counts for the circuits from get_circuits, in the same order.
+        # Expectation values that can be read from several of the circuits are averaged over them.
+        
+        samples, minus = self.get_tallies(counts)
+        for pauli in self.rho:
+            self.rho[pauli] = 1-2*minus[pauli]/samples[pauli]
+
+    def get_rho_adaptive(self,success_condition,eps,batch=64,confidence=0.95):
+        """
+        Determines the expectation values like get_rho, but with only as many shots as are needed to decide whether the values in success_condition
+        are within eps of their targets. Batches of shots are run until the confidence interval of each of these values lies either inside or outside
+        this range, or until self.shots have been run for each circuit. The other expectation values are set from the same shots.
+        
+        success_condition
+            Values for pauli observables, as in run_game.
+        eps
+            How close the expectation values need to be to the targets.
+        batch=64
+            Number of shots run for each circuit in each batch.
+        confidence=0.95
+            Probability that all intervals contain the true values, for all batches together.
+
+        Returns a dict with the estimate, the lower and upper bounds of its confidence interval and the number of samples for each pauli in success_condition,
+        and the number of shots run for each circuit.
+        """
         
-        # prob of expectation value -1 for two qubit observables
-        for basis in corr:
-            prob[basis] = 0
-            for string in results[basis]:
-                if string[0]!=string[1]:
-                    prob[basis] += results[basis][string]
-
-        for pauli in prob:
-            self.rho[pauli] = 1-2*prob[pauli]
+        if self.exact:
+            self.get_rho()
+            return {pauli:(self.rho[pauli],self.rho[pauli],self.rho[pauli],0) for pauli in success_condition}, 0
+
+        # the confidence is shared between all values and all batches at which the intervals are checked
+        looks = max(1,len(success_condition)) * max(1,math.ceil(self.shots/batch))
+        z = statistics.NormalDist().inv_cdf( 1-(1-confidence)/(2*looks) )
+
+        circuits = self.get_circuits()
+        counts = [{} for qc in circuits]
+        # with no shots at all, nothing is known about the values
+        bounds = {pauli:(self.rho[pauli],-1.0,1.0,0) for pauli in success_condition}
+        shots = 0
+        while shots<self.shots:
+            new_shots = min(batch,self.shots-shots)
+            result = execute(circuits, backend=self.backend, shots=new_shots).result()
+            for j in range(len(circuits)):
+                for string, number in result.get_counts(j).items():
+                    counts[j][string] = counts[j].get(string,0) + number
+            shots += new_shots
+
+            samples, minus = self.get_tallies(counts)
+            bounds = {}
+            decided = True
+            for pauli in success_condition:
+                # Wilson score interval for the probability of the value -1, which stays valid when all samples agree
+                n = samples[pauli]
+                p = minus[pauli]/n
+                center = (p+z**2/(2*n))/(1+z**2/n)
+                width = z*math.sqrt(p*(1-p)/n+z**2/(4*n**2))/(1+z**2/n)
+                lower, upper = 1-2*min(1.0,center+width), 1-2*max(0.0,center-width)
+                bounds[pauli] = (1-2*p, lower, upper, n)
+                target = success_condition[pauli]
+                inside = target-eps<lower and upper<target+eps
+                outside = upper<=target-eps or lower>=target+eps
+                decided = decided and (inside or outside)
+            if decided:
+                break
+
+        if shots:
+            self.set_rho(counts)
+        return bounds, shots
+
+    def get_rho(self):
+        # Runs the circuit specified by self.qc and determines the expectation values for 'ZI', 'IZ', 'ZZ', 'XI', 'IX', 'XX', 'ZX' and 'XZ' (and the ones with Ys too if needed).
+        # The circuits for all measurements share self.qc as their prefix, and are run together as a single job.
+        # Paulis that commute are measured together, so that 3 circuits are needed (or 5 with the Ys).
+        # In exact mode, the expectation values are instead calculated from the state vector.
+        # The values sampled for each prefix of self.qc are kept, so that they are reused rather than sampled again after an undo.
+        
+        if self.exact:
+            state = self.get_state()
+            for pauli in self.rho:
+                self.rho[pauli] = get_expectation(state,pauli)
+            return
+
+        self.trim_stacks()
+        length = len(self.qc.data)
+        if len(self.sampled)>length and self.sampled[length] is not None:
+            self.rho.update(self.sampled[length])
+            return
+        circuits = self.get_circuits()
+        result = execute(circuits, backend=self.backend, shots=self.shots).result()
+        self.set_rho([result.get_counts(j) for j in range(len(circuits))])
+        self.sampled += [None]*(length+1-len(self.sampled))
+        self.sampled[length] = dict(self.rho)
     
     def update_grid(self,rho=None,labels=False,bloch=None,hidden=[],qubit=True,corr=True,message=""):
         """
@@ -368,121 +728,4 @@ class pauli_grid():
             A string of text that is displayed below the grid.
         """
 
-        def see_if_unhidden(pauli):
-            # For a given Pauli, see whether its circle should be shown.
-            
-            unhidden = True
-            # first: does it act non-trivially on a qubit in `hidden`
-            for j in hidden:
-                unhidden = unhidden and (pauli[j]=='I')
-            # second: does it contain something other than 'I' or 'Z' when only bits are shown
-            if qubit==False:
-                for j in range(2):
-                    unhidden = unhidden and (pauli[j] in ['I','Z'])
-            # third: is it a correlation pauli when these are not allowed
-            if corr==False:
-                unhidden = unhidden and ((pauli[0]=='I') or (pauli[1]=='I'))
-            return unhidden
-
-        def add_line(line,pauli_pos,pauli):
-            """
-            For mode='line', add in the line.
-            
-            line = the type of line to be drawn (X, Z or the other one)
-            pauli = the box where the line is to be drawn
-            expect = the expectation value that determines its length
-            """
-            
-            unhidden = see_if_unhidden(pauli)
-            coord = None
-            p = (1-self.rho[pauli])/2 # prob of 1 output
-            # in the following, white lines goes from a to b, and black from b to c
-            if unhidden:
-                if line=='Z':
-                    a = ( self.box[pauli_pos][0], self.box[pauli_pos][1]+l/2 )
-                    c = ( self.box[pauli_pos][0], self.box[pauli_pos][1]-l/2 )
-                    b = ( (1-p)*a[0] + p*c[0] , (1-p)*a[1] + p*c[1] )
-                    lw = 8
-                    coord = (b[1] - (a[1]+c[1])/2)*1.2 + (a[1]+c[1])/2
-                elif line=='X':
-                    a = ( self.box[pauli_pos][0]+l/2, self.box[pauli_pos][1] )
-                    c = ( self.box[pauli_pos][0]-l/2, self.box[pauli_pos][1] )
-                    b = ( (1-p)*a[0] + p*c[0] , (1-p)*a[1] + p*c[1] )
-                    lw = 9
-                    coord = (b[0] - (a[0]+c[0])/2)*1.1 + (a[0]+c[0])/2
-                else:
-                    a = ( self.box[pauli_pos][0]+l/(2*np.sqrt(2)), self.box[pauli_pos][1]+l/(2*np.sqrt(2)) )
-                    c = ( self.box[pauli_pos][0]-l/(2*np.sqrt(2)), self.box[pauli_pos][1]-l/(2*np.sqrt(2)) )
-                    b = ( (1-p)*a[0] + p*c[0] , (1-p)*a[1] + p*c[1] )
-                    lw = 9
-                self.lines[pauli]['w'].pop(0).remove()
-                self.lines[pauli]['b'].pop(0).remove()
-                self.lines[pauli]['w'] = plt.plot( [a[0],b[0]], [a[1],b[1]], color=(1.0,1.0,1.0), lw=lw )
-                self.lines[pauli]['b'] = plt.plot( [b[0],c[0]], [b[1],c[1]], color=(0.0,0.0,0.0), lw=lw )
-                return coord
-        
-        l = 0.9 # line length
-        r = 0.6 # circle radius
-        L = 0.98*np.sqrt(2) # box height and width
-        
-        if rho==None:
-            self.get_rho()
-
-        # draw boxes
-        for pauli in self.box:
-            if 'I' in pauli:
-                color = self.colors[1]
-            else:
-                color = self.colors[2]
-            self.ax.add_patch( Rectangle( (self.box[pauli][0],self.box[pauli][1]-1), L, L, angle=45, color=color) )  
-
-        # draw circles
-        for pauli in self.box:
-            unhidden = see_if_unhidden(pauli)
-            if unhidden:
-                if self.mode=='line':
-                    self.ax.add_patch( Circle(self.box[pauli], r, color=(0.5,0.5,0.5)) )
-                else:
-                    prob = (1-self.rho[pauli])/2
-                    self.ax.add_patch( Circle(self.box[pauli], r, color=(prob,prob,prob)) )
-
-        # update bars if required
-        if self.mode=='line':
-            if bloch in ['0','1']:
-                for other in 'IXZ':
-                    px = other*(bloch=='1') + 'X' + other*(bloch=='0')
-                    pz = other*(bloch=='1') + 'Z' + other*(bloch=='0')
-                    z_coord = add_line('Z',pz,pz)
-                    x_coord = add_line('X',pz,px)
-                    for j in self.lines[pz]['c']:
-                        self.lines[pz]['c'][j].center = (x_coord,z_coord)
-                        self.lines[pz]['c'][j].radius = (j=='w')*0.05 + (j=='b')*0.04
-                px = 'I'*(bloch=='0') + 'X' + 'I'*(bloch=='1')
-                pz = 'I'*(bloch=='0') + 'Z' + 'I'*(bloch=='1')
-                add_line('Z',pz,pz)
-                add_line('X',px,px)
-            else:
-                for pauli in self.box:
-                    for j in self.lines[pauli]['c']:
-                        self.lines[pauli]['c'][j].radius = 0.0
-                    if pauli in ['ZI','IZ','ZZ']:
-                        add_line('Z',pauli,pauli)
-                    if pauli in ['XI','IX','XX']: 
-                        add_line('X',pauli,pauli)
-                    if pauli in ['XZ','ZX']:
-                        add_line('ZX',pauli,pauli)
-             
-        self.bottom.set_text(message)
-        
-        if labels:
-            for pauli in self.box:
-                plt.text(self.box[pauli][0]-0.18,self.box[pauli][1]-0.85, pauli)
-        
-        if self.y_boxes:
-            self.ax.set_xlim([-4,4])
-            self.ax.set_ylim([0,8])
-        else:
-            self.ax.set_xlim([-3,3])
-            self.ax.set_ylim([0,6])
-        
-        self.fig.canvas.draw()
\ No newline at end of file
+        _display().draw_grid(self,rho,labels,bloch,hidden,qubit,corr,message)
@@ -0,0 +1,424 @@
+# The rendering layer of hello_quantum, which draws the grids with matplotlib and implements
+# the puzzles with ipywidgets. It is imported by hello_quantum when first needed, so that the
+# game logic can be used without a display.
+
+from qiskit import BasicAer as Aer
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.patches import Circle, Rectangle
+import copy
+from ipywidgets import widgets  
+from IPython.display import display, clear_output 
+
+try:
+    from .hello_quantum import pauli_grid, solve, compile_program, apply_program, program_text
+except ImportError:
+    from hello_quantum import pauli_grid, solve, compile_program, apply_program, program_text
+
+def setup_figure(grid):
+    # Creates the figure for a pauli_grid, with the lines and circles used in mode='line'.
+    
+    grid.fig = plt.figure(figsize=(5,5),facecolor=grid.colors[0])
+    grid.ax = grid.fig.add_subplot(111)
+    plt.axis('off')
+    
+    grid.bottom = grid.ax.text(-3,1,"",size=9,va='top',color='w')
+    
+    grid.lines = {}
+    for pauli in grid.box:
+        w = plt.plot( [grid.box[pauli][0],grid.box[pauli][0]], [grid.box[pauli][1],grid.box[pauli][1]], color=(1.0,1.0,1.0), lw=0 )
+        b = plt.plot( [grid.box[pauli][0],grid.box[pauli][0]], [grid.box[pauli][1],grid.box[pauli][1]], color=(0.0,0.0,0.0), lw=0 )
+        c = {}
+        c['w'] = grid.ax.add_patch( Circle(grid.box[pauli], 0.0, color=(0,0,0), zorder=10) )
+        c['b'] = grid.ax.add_patch( Circle(grid.box[pauli], 0.0, color=(1,1,1), zorder=10) )
+        grid.lines[pauli] = {'w':w,'b':b,'c':c}
+
+def draw_grid(grid,rho=None,labels=False,bloch=None,hidden=[],qubit=True,corr=True,message=""):
+    # Draws the grid for pauli_grid.update_grid, which describes the arguments.
+    
+    if grid.fig is None:
+        setup_figure(grid)
+    plt.sca(grid.ax)
+
+    def see_if_unhidden(pauli):
+        # For a given Pauli, see whether its circle should be shown.
+        
+        unhidden = True
+        # first: does it act non-trivially on a qubit in `hidden`
+        for j in hidden:
+            unhidden = unhidden and (pauli[j]=='I')
+        # second: does it contain something other than 'I' or 'Z' when only bits are shown
+        if qubit==False:
+            for j in range(2):
+                unhidden = unhidden and (pauli[j] in ['I','Z'])
+        # third: is it a correlation pauli when these are not allowed
+        if corr==False:
+            unhidden = unhidden and ((pauli[0]=='I') or (pauli[1]=='I'))
+        return unhidden
+
+    def add_line(line,pauli_pos,pauli):
+        """
+        For mode='line', add in the line.
+        
+        line = the type of line to be drawn (X, Z or the other one)
+        pauli = the box where the line is to be drawn
+        expect = the expectation value that determines its length
+        """
+        
+        unhidden = see_if_unhidden(pauli)
+        coord = None
+        p = (1-grid.rho[pauli])/2 # prob of 1 output
+        # in the following, white lines goes from a to b, and black from b to c
+        if unhidden:
+            if line=='Z':
+                a = ( grid.box[pauli_pos][0], grid.box[pauli_pos][1]+l/2 )
+                c = ( grid.box[pauli_pos][0], grid.box[pauli_pos][1]-l/2 )
+                b = ( (1-p)*a[0] + p*c[0] , (1-p)*a[1] + p*c[1] )
+                lw = 8
+                coord = (b[1] - (a[1]+c[1])/2)*1.2 + (a[1]+c[1])/2
+            elif line=='X':
+                a = ( grid.box[pauli_pos][0]+l/2, grid.box[pauli_pos][1] )
+                c = ( grid.box[pauli_pos][0]-l/2, grid.box[pauli_pos][1] )
+                b = ( (1-p)*a[0] + p*c[0] , (1-p)*a[1] + p*c[1] )
+                lw = 9
+                coord = (b[0] - (a[0]+c[0])/2)*1.1 + (a[0]+c[0])/2
+            else:
+                a = ( grid.box[pauli_pos][0]+l/(2*np.sqrt(2)), grid.box[pauli_pos][1]+l/(2*np.sqrt(2)) )
+                c = ( grid.box[pauli_pos][0]-l/(2*np.sqrt(2)), grid.box[pauli_pos][1]-l/(2*np.sqrt(2)) )
+                b = ( (1-p)*a[0] + p*c[0] , (1-p)*a[1] + p*c[1] )
+                lw = 9
+            grid.lines[pauli]['w'].pop(0).remove()
+            grid.lines[pauli]['b'].pop(0).remove()
+            grid.lines[pauli]['w'] = plt.plot( [a[0],b[0]], [a[1],b[1]], color=(1.0,1.0,1.0), lw=lw )
+            grid.lines[pauli]['b'] = plt.plot( [b[0],c[0]], [b[1],c[1]], color=(0.0,0.0,0.0), lw=lw )
+            return coord
+    
+    l = 0.9 # line length
+    r = 0.6 # circle radius
+    L = 0.98*np.sqrt(2) # box height and width
+    
+    if rho==None:
+        grid.get_rho()
+
+    # draw boxes
+    for pauli in grid.box:
+        if 'I' in pauli:
+            color = grid.colors[1]
+        else:
+            color = grid.colors[2]
+        grid.ax.add_patch( Rectangle( (grid.box[pauli][0],grid.box[pauli][1]-1), L, L, angle=45, color=color) )  
+
+    # draw circles
+    for pauli in grid.box:
+        unhidden = see_if_unhidden(pauli)
+        if unhidden:
+            if grid.mode=='line':
+                grid.ax.add_patch( Circle(grid.box[pauli], r, color=(0.5,0.5,0.5)) )
+            else:
+                prob = (1-grid.rho[pauli])/2
+                grid.ax.add_patch( Circle(grid.box[pauli], r, color=(prob,prob,prob)) )
+
+    # update bars if required
+    if grid.mode=='line':
+        if bloch in ['0','1']:
+            for other in 'IXZ':
+                px = other*(bloch=='1') + 'X' + other*(bloch=='0')
+                pz = other*(bloch=='1') + 'Z' + other*(bloch=='0')
+                z_coord = add_line('Z',pz,pz)
+                x_coord = add_line('X',pz,px)
+                for j in grid.lines[pz]['c']:
+                    grid.lines[pz]['c'][j].center = (x_coord,z_coord)
+                    grid.lines[pz]['c'][j].radius = (j=='w')*0.05 + (j=='b')*0.04
+            px = 'I'*(bloch=='0') + 'X' + 'I'*(bloch=='1')
+            pz = 'I'*(bloch=='0') + 'Z' + 'I'*(bloch=='1')
+            add_line('Z',pz,pz)
+            add_line('X',px,px)
+        else:
+            for pauli in grid.box:
+                for j in grid.lines[pauli]['c']:
+                    grid.lines[pauli]['c'][j].radius = 0.0
+                if pauli in ['ZI','IZ','ZZ']:
+                    add_line('Z',pauli,pauli)
+                if pauli in ['XI','IX','XX']: 
+                    add_line('X',pauli,pauli)
+                if pauli in ['XZ','ZX']:
+                    add_line('ZX',pauli,pauli)
+         
+    grid.bottom.set_text(message)
+    
+    if labels:
+        for pauli in grid.box:
+            plt.text(grid.box[pauli][0]-0.18,grid.box[pauli][1]-0.85, pauli)
+    
+    if grid.y_boxes:
+        grid.ax.set_xlim([-4,4])
+        grid.ax.set_ylim([0,8])
+    else:
+        grid.ax.set_xlim([-3,3])
+        grid.ax.set_ylim([0,6])
+    
+    grid.fig.canvas.draw()
+
+class run_game():
+    # Implements a puzzle, which is defined by the given inputs.
+    
+    def __init__(self,initialize, success_condition, allowed_gates, vi, qubit_names, eps=0.1, backend=Aer.get_backend('qasm_simulator'), shots=1024,mode='circle',verbose=False,exact=False,adaptive=False):
+        """
+        initialize
+            List of gates applied to the initial 00 state to get the starting state of the puzzle.
+            Supported single qubit gates (applied to qubit '0' or '1') are 'x', 'y', 'z', 'h', 'ry(pi/4)'.
+            Supported two qubit gates are 'cz' and 'cx'. Specify only the target qubit.
+        success_condition
+            Values for pauli observables that must be obtained for the puzzle to declare success.
+        allowed_gates
+            For each qubit, specify which operations are allowed in this puzzle. 'both' should be used only for operations that don't need a qubit to be specified ('cz' and 'unbloch').
+            Gates are expressed as a dict with an int as value. If this is non-zero, it specifies the number of times the gate is must be used (no more or less) for the puzzle to be successfully solved. If the value is zero, the player can use the gate any number of times. 
+        vi
+            Some visualization information as a three element list. These specify:
+            * which qubits are hidden (empty list if both shown).
+            * whether both circles shown for each qubit (use True for qubit puzzles and False for bit puzzles).
+            * whether the correlation circles (the four in the middle) are shown.
+        qubit_names
+            The two qubits are always called '0' and '1' from the programming side. But for the player, we can display different names.
+        eps=0.1
+            How close the expectation values need to be to the targets for success to be declared.
+            Only used when sampling: in exact mode, they only need to match the targets to 3 decimal places.
+        backend=Aer.get_backend('qasm_simulator')
+            Backend to be used by Qiskit to calculate expectation values (defaults to local simulator).
+        shots=1024
+            Number of shots used to to calculate expectation values (the maximum number, if adaptive).
+        mode='circle'
+            Either the standard 'Hello Quantum' visualization can be used (with mode='circle'), or the extended one (mode='y') or the alternative line based one (mode='line').
+        y_boxes = False
+            Whether to show expectation values involving y.
+        verbose=False     
+        exact=False
+            Whether to calculate the expectation values exactly from the state vector, instead of sampling them with the backend.
+        adaptive=False
+            Whether to sample the expectation values in small batches of shots, until it is clear whether each value in success_condition is within eps
+            of its target or not. This is faster, but the values shown on the grid are then less precise. With verbose=True, the confidence intervals
+            of these values and the number of shots are printed.
+        """
+
+        def get_total_gate_list():
+            # Get a text block describing allowed gates.
+            
+            total_gate_list = ""
+            for qubit in allowed_gates:
+                gate_list = ""
+                for gate in allowed_gates[qubit]:
+                    if required_gates[qubit][gate] > 0 :
+                        gate_list += '  ' + gate+" (use "+str(required_gates[qubit][gate])+" time"+"s"*(required_gates[qubit][gate]>1)+")"
+                    elif allowed_gates[qubit][gate]==0:
+                        gate_list += '  '+gate + ' '
+                if gate_list!="":
+                    if qubit=="both" :
+                        gate_list = "\nAllowed symmetric operations:" + gate_list
+                    else :
+                        gate_list = "\nAllowed operations for " + qubit_names[qubit] + ":\n" + " "*10 + gate_list
+                    total_gate_list += gate_list +"\n"
+            return total_gate_list
+
+        def get_success(required_gates):
+            # Determine whether the success conditions are satisfied, both for expectation values, and the number of gates to be used.
+            
+            success = True
+            if verbose:
+                print(grid.rho)
+            tolerance = 1e-3 if exact else eps
+            for pauli in success_condition:
+                success = success and (abs(success_condition[pauli] - grid.rho[pauli])<tolerance)
+            for qubit in required_gates:
+                for gate in required_gates[qubit]:
+                    success = success and (required_gates[qubit][gate]==0)
+            return success
+        
+        def show_circuit():
+            gates = get_total_gate_list
+
+        def update():
+            # Determines the expectation values and redraws the grid.
+            
+            if adaptive and not exact:
+                bounds, used_shots = grid.get_rho_adaptive(success_condition,eps)
+                if verbose:
+                    for pauli in bounds:
+                        print(pauli+' = %.3f, between %.3f and %.3f from %d samples' % bounds[pauli])
+                    print(str(used_shots)+' shots for each of '+str(len(grid.get_plan()))+' circuits')
+            else:
+                grid.get_rho()
+            grid.update_grid(rho=grid.rho,bloch=bloch[0],hidden=vi[0],qubit=vi[1],corr=vi[2],message=get_total_gate_list())
+
+        clear_output()
+        bloch = [None]
+
+        # set up initial state and figure
+        if mode=='y':
+            grid = pauli_grid(backend=backend,shots=shots,mode='circle',y_boxes=True,exact=exact)
+        else:
+            grid = pauli_grid(backend=backend,shots=shots,mode=mode,exact=exact)
+        apply_program(compile_program(initialize),grid.qc,grid.qr)
+
+        required_gates = copy.deepcopy(allowed_gates)
+
+        # determine which qubits to show in figure
+        if allowed_gates['0']=={} : # if no gates are allowed for qubit 0, we know to only show qubit 1
+                shown_qubit = 1
+        elif allowed_gates['1']=={} : # and vice versa
+                shown_qubit = 0
+        else :
+                shown_qubit = 2
+
+        # show figure
+        update()
+
+
+        description = {'gate':['Choose gate'],'qubit':['Choose '+'qu'*vi[1]+'bit'],'action':['Make it happen!']}
+
+        all_allowed_gates_raw = []
+        for q in ['0','1','both']:
+            all_allowed_gates_raw += list(allowed_gates[q])
+        all_allowed_gates_raw = list(set(all_allowed_gates_raw))
+
+        all_allowed_gates = []
+        for g in ['bloch','unbloch']:
+            if g in all_allowed_gates_raw:
+                all_allowed_gates.append( g )
+        for g in ['x','y','z','h','cz','cx']:
+            if g in all_allowed_gates_raw:
+                all_allowed_gates.append( g )
+        for g in all_allowed_gates_raw:
+            if g not in all_allowed_gates:
+                all_allowed_gates.append( g )
+
+        gate = widgets.ToggleButtons(options=description['gate']+all_allowed_gates)
+        qubit = widgets.ToggleButtons(options=[''])
+        action = widgets.ToggleButtons(options=[''])
+
+        boxes = widgets.VBox([gate,qubit,action])
+        display(boxes)
+        if qubit_names=={'0':'q[0]', '1':'q[1]'}:
+            print('\nYour quantum program so far:\n\n    q = QuantumRegister(2)\n    b = ClassicalRegister(2)\n    qc = QuantumCircuit(q,b)\n')
+        # the moves applied so far, as Qiskit code and as (gate code, target qubit) rows of a compiled program
+        self.program = []
+        self.operations = []
+
+        def given_gate(a):
+            # Action to be taken when gate is chosen. This sets up the system to choose a qubit.
+            
+            if gate.value:
+                if gate.value in allowed_gates['both']:
+                    qubit.options = description['qubit'] + ["not required"]
+                    qubit.value = "not required"
+                else:
+                    allowed_qubits = []
+                    for q in ['0','1']:
+                        if (gate.value in allowed_gates[q]) or (gate.value in allowed_gates['both']):
+                            allowed_qubits.append(q)
+                    allowed_qubit_names = []
+                    for q in allowed_qubits:
+                        allowed_qubit_names += [qubit_names[q]]
+                    qubit.options = description['qubit'] + allowed_qubit_names
+
+        def given_qubit(b):
+            # Action to be taken when qubit is chosen. This sets up the system to choose an action.
+            
+            if qubit.value not in ['',description['qubit'][0],'Success!']:
+                action.options = description['action']+['Apply operation']
+                
+        def given_action(c):
+            # Action to be taken when user confirms their choice of gate and qubit.
+            # This applied the command, updates the visualization and checks whether the puzzle is solved.
+            
+            if action.value not in ['',description['action'][0]]:
+                # apply operation
+                if action.value=='Apply operation':
+                    if qubit.value not in ['',description['qubit'][0],'Success!']:
+                        # translate bit gates to qubit gates
+                        if gate.value=='NOT':
+                            q_gate = 'x'
+                        elif gate.value=='CNOT':
+                            q_gate = 'cx'
+                        else:
+                            q_gate = gate.value
+                        if qubit.value=="not required":
+                            q = qubit_names['1']
+                        else:
+                            q = qubit.value
+                        q01 = '0'*(qubit.value==qubit_names['0']) + '1'*(qubit.value==qubit_names['1']) + 'both'*(qubit.value=="not required")     
+                        move = {'qubit':q01, 'gate':gate.value, 'bloch':bloch[0], 'applied':False, 'counted':False}
+                        if q_gate in ['bloch','unbloch']:
+                            if q_gate=='bloch':
+                                bloch[0] = q01
+                            else:
+                                bloch[0] = None
+                        else:
+                            operation = compile_program([(q_gate,q01)])
+                            apply_program(operation,grid.qc,grid.qr)
+                            command = program_text(operation,qubit_names)[0]
+                            if qubit_names in [{'0':'q[0]', '1':'q[1]'},{'0':'A', '1':'B'}]:
+                                print('    ' + command)
+                            self.program.append( command )
+                            self.operations.append( tuple(operation[0].tolist()) )
+                            move['applied'] = True
+                        if required_gates[q01][gate.value]>0:
+                            required_gates[q01][gate.value] -= 1
+                            move['counted'] = True
+                        history.append(move)
+
+                        update()
+
+                success = get_success(required_gates)
+                if success:
+                    gate.options = ['Success!']
+                    qubit.options = ['Success!']
+                    action.options = ['Success!']
+                    plt.close(grid.fig)
+                else:
+                    gate.value = description['gate'][0]  
+                    qubit.options = ['']
+                    action.options = ['']  
+
+        def undo():
+            # Undoes the last operation made by the player. The previous state is taken from the grid's stack, rather than recalculated.
+            
+            if history:
+                move = history.pop()
+                if move['applied']:
+                    grid.undo()
+                    self.program.pop()
+                    self.operations.pop()
+                bloch[0] = move['bloch']
+                if move['counted']:
+                    required_gates[move['qubit']][move['gate']] += 1
+                update()
+
+        def hint():
+            # Prints and returns the first move of a shortest solution from the current state, or None if there is none.
+            # The search is kept short, so that the button answers quickly: with gate sets such as the ry and rx rotations of
+            # the sandbox, the state graph is too large to search in full.
+            
+            remaining = {q:{g:required_gates[q][g] for g in allowed_gates[q]} for q in allowed_gates}
+            try:
+                solution = solve(initialize,success_condition,remaining,state=grid.get_state(),max_moves=20,max_states=10000)
+            except ValueError:
+                print('No hint is available for this puzzle, as there are too many possible states to search.')
+                return None
+            if not solution:
+                print('No solution can be found from here. Try undoing some operations.')
+                return None
+            hint_gate, hint_qubit = solution[0]
+            if hint_qubit=='both':
+                print('Hint: apply '+hint_gate)
+            else:
+                print('Hint: apply '+hint_gate+' to '+qubit_names[hint_qubit])
+            return solution[0]
+
+        history = []
+        self.undo = undo
+        self.hint = hint
+
+        gate.observe(given_gate)
+        qubit.observe(given_qubit)
+        action.observe(given_action)
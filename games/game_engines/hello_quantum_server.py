@@ -0,0 +1,275 @@
+# A server that hosts the pauli_grids of many players at once, such as a whole classroom playing
+# Hello Quantum. Rather than each grid running its own job for every move, the expectation
+# values requested by all players within a short window are sampled together in one job, and
+# the results are then shared out to each grid. It only needs the game logic, not a display.
+#
+# To simulate a classroom with the local stand-in backend:
+#
+#     python hello_quantum_server.py --students 200 --moves 10
+
+import asyncio
+import concurrent.futures
+import time
+import random
+import argparse
+import statistics
+
+import numpy as np
+from qiskit import BasicAer as Aer
+from qiskit import execute
+
+try:
+    from .hello_quantum import pauli_grid, compile_program, apply_program, apply_instruction
+except ImportError:
+    from hello_quantum import pauli_grid, compile_program, apply_program, apply_instruction
+
+class local_backend():
+    # A stand-in for a simulator, for testing without Qiskit's backends. Counts are sampled with NumPy from the exact
+    # state vector, after a fixed delay for each job that stands in for the time spent queueing and simulating.
+
+    def __init__(self,delay=0.05,seed=None):
+        """
+        delay=0.05
+            Time in seconds taken by each job, however many circuits it has.
+        seed=None
+            Seed for the random number generator used to sample the counts.
+        """
+
+        self.delay = delay
+        self.rng = np.random.default_rng(seed)
+        self.jobs = 0
+        self.circuits = 0
+
+    def get_counts(self,qc,shots):
+        # Returns sampled counts for a circuit from get_circuits, whose gates are followed by measurements of qubit j to bit j.
+
+        state = np.array([1,0,0,0],dtype=complex)
+        for instruction in qc.data:
+            if instruction[0].name!='measure':
+                state = apply_instruction(qc,instruction,state)
+        samples = self.rng.multinomial(shots,np.abs(state)**2/np.sum(np.abs(state)**2))
+        return {format(index,'02b'):int(samples[index]) for index in range(4) if samples[index]}
+
+    def run_circuits(self,circuits,shots):
+        # Returns the counts for each of the circuits, run as one job.
+
+        time.sleep(self.delay)
+        self.jobs += 1
+        self.circuits += len(circuits)
+        return [self.get_counts(qc,shots) for qc in circuits]
+
+class grid_session():
+    # The grid of a single player on a grid_server. Moves are queued, and are applied in order by a task of the session.
+    # At most max_pending moves can wait in the queue, after which submit() waits for space: this is the backpressure
+    # that stops one player from filling up the jobs that everyone shares.
+
+    def __init__(self,server,grid,max_pending):
+
+        self.server = server
+        self.grid = grid
+        self.queue = asyncio.Queue(max_pending)
+        self.task = asyncio.ensure_future(self.worker())
+
+    async def submit(self,gate,qubit):
+        # Queues a (gate,qubit) move, as used in allowed_gates, or the gate 'undo' to undo the last one.
+        # Returns a future for the expectation values after the move.
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((gate,qubit,future))
+        return future
+
+    async def apply(self,gate,qubit):
+        # Applies a move, and returns the expectation values after it.
+
+        return await (await self.submit(gate,qubit))
+
+    async def worker(self):
+
+        while True:
+            gate, qubit, future = await self.queue.get()
+            try:
+                if gate=='undo':
+                    self.grid.undo()
+                else:
+                    apply_program(compile_program([(gate,qubit)]),self.grid.qc,self.grid.qr)
+                rho = await self.server.get_rho(self.grid)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as error:
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.cancelled():
+                    future.set_result(rho)
+
+    def close(self):
+        # Stops the session. The move being applied and any moves still in the queue are cancelled.
+
+        self.task.cancel()
+        while not self.queue.empty():
+            gate, qubit, future = self.queue.get_nowait()
+            future.cancel()
+
+class grid_server():
+    # Hosts the grids of many players, and coalesces the jobs needed to sample their expectation values.
+
+    def __init__(self,backend=Aer.get_backend('qasm_simulator'),shots=1024,window=0.02,max_circuits=1000,max_pending=4,y_boxes=False,exact=False):
+        """
+        backend=Aer.get_backend('qasm_simulator')
+            Backend to be used by Qiskit to calculate expectation values, or a stand-in with a run_circuits method such as local_backend.
+        shots=1024
+            Number of shots used to to calculate expectation values.
+        window=0.02
+            Time in seconds for which requests are collected before they are run together as one job.
+            Only one job runs at a time (Qiskit's transpiler is not thread safe), and requests made while one is running wait for it to finish.
+        max_circuits=1000
+            Number of waiting circuits for which a job is started without waiting for the end of the window.
+        max_pending=4
+            Maximum number of moves that each player can have waiting to be applied.
+        y_boxes=False
+            Whether the grids include Y expectation values.
+        exact=False
+            Whether to calculate the expectation values exactly for each grid, in which case there are no jobs to coalesce.
+        """
+
+        self.backend = backend
+        self.shots = shots
+        self.window = window
+        self.max_circuits = max_circuits
+        self.max_pending = max_pending
+        self.y_boxes = y_boxes
+        self.exact = exact
+
+        self.sessions = {}
+        # requests waiting to be run, as (circuits, future) pairs
+        self.pending = []
+        self.pending_circuits = 0
+        self.timer = None
+        self.running = False
+        self.executor = concurrent.futures.ThreadPoolExecutor(1)
+        self.jobs = 0
+
+    def open_session(self,name,initialize=[]):
+        # Creates the grid of a new player, starting from the state given by a list of (gate,qubit) moves as in run_game.
+
+        if name in self.sessions:
+            raise ValueError("There is already a session called '"+str(name)+"'.")
+        grid = pauli_grid(backend=self.backend,shots=self.shots,y_boxes=self.y_boxes,exact=self.exact)
+        apply_program(compile_program(initialize),grid.qc,grid.qr)
+        self.sessions[name] = grid_session(self,grid,self.max_pending)
+        return self.sessions[name]
+
+    def close_session(self,name):
+
+        self.sessions.pop(name).close()
+
+    async def get_rho(self,grid):
+        # Determines the expectation values of the grid, as pauli_grid.get_rho does, but with its circuits run as part of a shared job.
+        # Returns a copy of them.
+
+        if grid.exact:
+            grid.get_rho()
+            return dict(grid.rho)
+        circuits = grid.get_circuits()
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((circuits,future))
+        self.pending_circuits += len(circuits)
+        if self.pending_circuits>=self.max_circuits:
+            self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window,self.flush)
+        grid.set_rho(await future)
+        return dict(grid.rho)
+
+    def flush(self):
+        # Starts a job for all waiting requests, unless one is already running, in which case it is started when that one finishes.
+
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        if self.pending and not self.running:
+            self.running = True
+            batch = self.pending
+            self.pending = []
+            self.pending_circuits = 0
+            asyncio.ensure_future(self.run_batch(batch))
+
+    def run_circuits(self,circuits):
+        # Returns the counts for each of the circuits, run as a single job.
+
+        if hasattr(self.backend,'run_circuits'):
+            return self.backend.run_circuits(circuits,self.shots)
+        result = execute(circuits, backend=self.backend, shots=self.shots).result()
+        return [result.get_counts(j) for j in range(len(circuits))]
+
+    async def run_batch(self,batch):
+        # Runs a job for a batch of requests in another thread, and shares the counts out to the requests.
+
+        circuits = [qc for request, future in batch for qc in request]
+        self.jobs += 1
+        try:
+            counts = await asyncio.get_running_loop().run_in_executor(self.executor,self.run_circuits,circuits)
+        except Exception as error:
+            for request, future in batch:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        finally:
+            self.running = False
+            if self.pending:
+                self.flush()
+        start = 0
+        for request, future in batch:
+            if not future.done():
+                future.set_result(counts[start:start+len(request)])
+            start += len(request)
+
+async def simulate_classroom(server,students=200,moves=10,think=0.5,seed=0):
+    # Simulates students who each make random moves, with random pauses between them of up to think seconds.
+    # Returns the time taken for each move to be answered.
+
+    rng = random.Random(seed)
+    latencies = []
+
+    async def student(name):
+        session = server.open_session(name)
+        for _ in range(moves):
+            await asyncio.sleep(rng.uniform(0,think))
+            start = time.perf_counter()
+            await session.apply(rng.choice(['x','z','h','cz','cx']),rng.choice(['0','1']))
+            latencies.append(time.perf_counter()-start)
+        server.close_session(name)
+
+    await asyncio.gather(*[student(name) for name in range(students)])
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a classroom of Hello Quantum players on one server.')
+    parser.add_argument('--students', type=int, default=200,
+                        help='number of players (default: 200)')
+    parser.add_argument('--moves', type=int, default=10,
+                        help='number of moves made by each player (default: 10)')
+    parser.add_argument('--think', type=float, default=0.5,
+                        help='maximum time in seconds between the moves of a player (default: 0.5)')
+    parser.add_argument('--window', type=float, default=0.02,
+                        help='time in seconds for which requests are coalesced (default: 0.02)')
+    parser.add_argument('--delay', type=float, default=0.05,
+                        help='time in seconds taken by each job of the local backend (default: 0.05)')
+    parser.add_argument('--qiskit', action='store_true',
+                        help="use Qiskit's qasm_simulator, instead of the local stand-in backend")
+    args = parser.parse_args()
+
+    backend = Aer.get_backend('qasm_simulator') if args.qiskit else local_backend(delay=args.delay,seed=0)
+    server = grid_server(backend=backend,window=args.window)
+    start = time.perf_counter()
+    latencies = asyncio.run(simulate_classroom(server,args.students,args.moves,args.think))
+    wall = time.perf_counter()-start
+
+    latencies.sort()
+    print('%d moves by %d students in %.2f s, using %d jobs' % (len(latencies),args.students,wall,server.jobs))
+    print('latency (s): median %.3f, 95th percentile %.3f, max %.3f' % (statistics.median(latencies),
+                                                                        latencies[int(0.95*(len(latencies)-1))],latencies[-1]))
+
+if __name__ == '__main__':
+    main()
@@ -1 +1,10 @@
-from .quantum_slot import quantum_slot_machine
\ No newline at end of file
+from .core import *
+
+
+def quantum_slot_machine():
+    """A slot machine that uses random numbers generated
+    by quantum mechanical processses.
+    """
+    # the widgets are only imported and built when the machine is first shown
+    from . import quantum_slot
+    quantum_slot.quantum_slot_machine()
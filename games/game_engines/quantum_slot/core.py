@@ -0,0 +1,121 @@
+"""The game logic of the quantum slot machine, which can be used without
+a display. The IBM Q account is only loaded when a device is first needed.
+"""
+import json
+from urllib.parse import urlencode
+from urllib.request import urlopen
+from qiskit import execute, QuantumCircuit, QuantumRegister, ClassicalRegister, BasicAer
+
+__all__ = ['get_provider', 'choose_backend', 'simulator_ints', 'anu_ints',
+           'ibmq_job', 'job_ints', 'payout_value']
+
+ANU_URL = 'https://qrng.anu.edu.au/API/jsonI.php'
+
+_PROVIDER = []
+
+
+def get_provider():
+    """Returns the IBM Q provider, loading the account on the first call.
+    """
+    if not _PROVIDER:
+        from qiskit import IBMQ
+        _PROVIDER.append(IBMQ.load_account())
+    return _PROVIDER[0]
+
+
+def choose_backend():
+    from qiskit.providers.ibmq import least_busy
+    large_enough_devices = get_provider().backends(
+        filters=lambda x: x.configuration().n_qubits >= 3
+        and not x.configuration().simulator)
+    return least_busy(large_enough_devices)
+
+
+def simulator_ints():
+    """Returns three random ints from 0 to 7, from 9 qubits in
+    superposition on the local simulator.
+    """
+    back = BasicAer.get_backend('qasm_simulator')
+    q = QuantumRegister(9, name='q')
+    c = ClassicalRegister(9, name='c')
+    qc = QuantumCircuit(q, c)
+    for kk in range(9):
+        qc.h(q[kk])
+    qc.measure(q, c)
+    job = execute(qc, backend=back, shots=1)
+    result = job.result()
+    counts = list(result.get_counts().keys())[0]
+    return int(counts[0:3], 2), int(counts[3:6], 2), int(counts[6:9], 2)
+
+
+def anu_ints():
+    """Returns three random ints from 0 to 7, from the ANU quantum
+    random number generator.
+    """
+    url = ANU_URL + '?' + urlencode({'type': 'hex16',
+                                     'length': 3,
+                                     'size': 1})
+    data = json.loads(urlopen(url).read().decode('ascii'))
+    rngs = [int(bin(int(kk, 16))[2:].zfill(8)[:3], 2)
+            for kk in data['data']]
+    return rngs[0], rngs[1], rngs[2]
+
+
+def ibmq_job(back=None, shots=300):
+    """Submits a job that measures 3 qubits in superposition, on the
+    least busy device by default.
+    """
+    if back is None:
+        back = choose_backend()
+    q = QuantumRegister(3, name='q')
+    c = ClassicalRegister(3, name='c')
+    qc = QuantumCircuit(q, c)
+    for kk in range(3):
+        qc.h(q[kk])
+    qc.measure(q, c)
+    return execute(qc, backend=back, shots=shots, memory=True)
+
+
+def job_ints(job):
+    """Returns the ints from 0 to 7 measured by an ibmq_job, one per shot.
+    """
+    return [int(kk, 16) for kk in job.result().results[0].data.memory]
+
+
+def payout_value(ints):
+    """Returns the credits won by the three given symbols.
+    """
+    #Paytable
+    # all sevens
+    if all([x == 7 for x in ints]):
+        value = 700
+    # all watermelons
+    elif all([x == 6 for x in ints]):
+        value = 200
+    # all strawberry
+    elif all([x == 5 for x in ints]):
+        value = 10
+    # all orange
+    elif all([x == 4 for x in ints]):
+        value = 20
+    # all lemon
+    elif all([x == 3 for x in ints]):
+        value = 60
+    # all grape
+    elif all([x == 2 for x in ints]):
+        value = 15
+    # all cherry
+    elif all([x == 1 for x in ints]):
+        value = 40
+    # all bell
+    elif all([x == 0 for x in ints]):
+        value = 80
+    # two bells
+    elif sum([x == 0 for x in ints]) == 2:
+        value = 5
+    # two bells
+    elif sum([x == 0 for x in ints]) == 1:
+        value = 1
+    else:
+        value = 0
+    return value
@@ -1,17 +1,12 @@
 import threading
 import os
-import json
-from urllib.parse import urlencode
-from urllib.request import urlopen
 from IPython.display import display
 import ipywidgets as widgets
-from qiskit import IBMQ, execute, QuantumCircuit, QuantumRegister, ClassicalRegister, BasicAer
 from qiskit.tools.monitor import job_monitor
+from .core import simulator_ints, anu_ints, ibmq_job, job_ints, payout_value
 
 script_dir = os.path.dirname(__file__)
 
-MY_PROVIDER = IBMQ.load_account()
-
 
 __all__ = ['quantum_slot_machine']
 
@@ -29,17 +24,7 @@ def quantum_slot_machine():
 
 def get_slot_values(backend, qslot):
     if backend == 'qasm_simulator':
-        back = BasicAer.get_backend('qasm_simulator')
-        q = QuantumRegister(9, name='q')
-        c = ClassicalRegister(9, name='c')
-        qc = QuantumCircuit(q, c)
-        for kk in range(9):
-            qc.h(q[kk])
-        qc.measure(q, c)
-        job = execute(qc, backend=back, shots=1)
-        result = job.result()
-        counts = list(result.get_counts().keys())[0]
-        return int(counts[0:3], 2), int(counts[3:6], 2), int(counts[6:9], 2)
+        return simulator_ints()
     elif backend == 'ibmqx2':
         int1 = qslot.children[0]._stored_ints.pop(0)
         int2 = qslot.children[0]._stored_ints.pop(0)
@@ -50,14 +35,7 @@ def get_slot_values(backend, qslot):
         return int1, int2, int3
 
     elif backend == 'ANU QRNG':
-        URL = 'https://qrng.anu.edu.au/API/jsonI.php'
-        url = URL + '?' + urlencode({'type': 'hex16',
-                                     'length': 3,
-                                     'size': 1})
-        data = json.loads(urlopen(url).read().decode('ascii'))
-        rngs = [int(bin(int(kk, 16))[2:].zfill(8)[:3], 2)
-                for kk in data['data']]
-        return rngs[0], rngs[1], rngs[2]
+        return anu_ints()
     else:
         raise Exception('Invalid backend choice.')
 
@@ -77,39 +55,7 @@ def update_credits(change, qslot):
 
 def compute_payout(ints, qslot):
     out = 1
-    #Paytable
-    # all sevens
-    if all([x == 7 for x in ints]):
-        value = 700
-    # all watermelons
-    elif all([x == 6 for x in ints]):
-        value = 200
-    # all strawberry
-    elif all([x == 5 for x in ints]):
-        value = 10
-    # all orange
-    elif all([x == 4 for x in ints]):
-        value = 20
-    # all lemon
-    elif all([x == 3 for x in ints]):
-        value = 60
-    # all grape
-    elif all([x == 2 for x in ints]):
-        value = 15
-    # all cherry
-    elif all([x == 1 for x in ints]):
-        value = 40
-    # all bell
-    elif all([x == 0 for x in ints]):
-        value = 80
-    # two bells
-    elif sum([x == 0 for x in ints]) == 2:
-        value = 5
-    # two bells
-    elif sum([x == 0 for x in ints]) == 1:
-        value = 1
-    else:
-        value = 0
+    value = payout_value(ints)
     if value:
         update_credits(value, qslot)
 
@@ -133,31 +79,23 @@ def pull_slot(b):
     if alive:
         b.disabled = False
 
-def choose_backend():
-    from qiskit.providers.ibmq import least_busy
-    large_enough_devices = MY_PROVIDER.backends(
-        filters=lambda x: x.configuration().n_qubits >= 3
-        and not x.configuration().simulator)
-    return least_busy(large_enough_devices)
-
 # generate new ibm q values
 def get_ibmq_ints(qslot):
     qslot.children[1].children[0].options = ['qasm_simulator', 'ANU QRNG']
     qslot.children[1].children[0].value = 'qasm_simulator'
-#    back = MY_PROVIDER.get_backend('ibmq_essex')
-    back = choose_backend()
-    q = QuantumRegister(3, name='q')
-    c = ClassicalRegister(3, name='c')
-    qc = QuantumCircuit(q, c)
-    for kk in range(3):
-        qc.h(q[kk])
-    qc.measure(q, c)
-    job = execute(qc, backend=back, shots=300, memory=True)
     qslot.children[1].children[2].clear_output()
+    # this runs in its own thread, where an error would otherwise go unseen,
+    # so it is shown below the machine and the ibmqx2 option stays hidden
     with qslot.children[1].children[2]:
-        job_monitor(job)
-    qslot.children[0]._stored_ints = [
-        int(kk, 16) for kk in job.result().results[0].data.memory]
+        try:
+#            job = ibmq_job(get_provider().get_backend('ibmq_essex'))
+            job = ibmq_job()
+            job_monitor(job)
+            ints = job_ints(job)
+        except Exception as error:
+            print('IBM Q is unavailable: %s: %s' % (type(error).__name__, error))
+            return
+    qslot.children[0]._stored_ints = ints
 
     qslot.children[1].children[0].options = ['qasm_simulator', 'ibmqx2', 'ANU QRNG']
 
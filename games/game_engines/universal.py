@@ -1,10 +1,15 @@
 import numpy as np
 import random
-import matplotlib.pyplot as plt
-from matplotlib.patches import Circle, Rectangle
 import os
-import copy
-import networkx as nx
+
+def _display():
+    # Returns the rendering layer, which needs matplotlib, and so is only imported when first used.
+    
+    try:
+        from . import universal_display
+    except ImportError:
+        import universal_display
+    return universal_display
 
 class layout:
     """Processing and display of data in ways that depend on the layout of a quantum device."""
@@ -55,6 +60,8 @@ class layout:
         
     def matching(self,weights={}):
         
+        import networkx as nx
+        
         if not weights:
             for pair in self.links:
                 weights[pair] = random.random()
@@ -79,88 +86,4 @@ class layout:
         The kwargs should all be supplied in the form of dictionaries for which qubit numbers and pair labels are the keys (i.e., the same keys as for the `pos` attribute).
         
         If `probs` is supplied (such as from the output of the `calculate_probs()` method, the labels, colors and sizes of qubits and links will be determined by these probabilities. Otherwise, the other kwargs set these properties directly."""                
-        G=nx.Graph()
-        
-        for pair in self.links:
-            G.add_edge(self.links[pair][0],self.links[pair][1])
-            G.add_edge(self.links[pair][0],pair)
-            G.add_edge(self.links[pair][1],pair)
-        
-        if probs:
-            
-            label_changes = copy.deepcopy(labels)
-            color_changes = copy.deepcopy(colors)
-            size_changes = copy.deepcopy(sizes)
-            
-            labels = {}
-            colors = {}
-            sizes = {}
-            for node in G:
-                if probs[node]>1:
-                    labels[node] = ""
-                    colors[node] = 'grey'
-                    sizes[node] = 3000
-                else:
-                    labels[node] = "%.0f" % ( 100 * ( probs[node] ) )
-                    colors[node] =( 1-probs[node],0,probs[node] )
-                    if type(node)!=str:
-                        if labels[node]=='0':
-                            sizes[node] = 3000
-                        else:
-                            sizes[node] = 4000 
-                    else:
-                        if labels[node]=='0':
-                            sizes[node] = 800
-                        else:
-                            sizes[node] = 1150
-                                         
-            for node in label_changes:
-                labels[node] = label_changes[node]
-            for node in color_changes:
-                colors[node] = color_changes[node]      
-            for node in size_changes:
-                sizes[node] = size_changes[node]                   
-                                        
-        else:
-            if not labels:
-                labels = {}
-                for node in G:
-                    labels[node] = node
-            if not colors:
-                colors = {}
-                for node in G:
-                    if type(node) is int:
-                        colors[node] = (node/self.num,0,1-node/self.num)
-                    else:
-                        colors[node] = (0,0,0)
-            if not sizes:
-                sizes = {}
-                for node in G:
-                    if type(node)!=str:
-                        sizes[node] = 3000
-                    else:
-                        sizes[node] = 750
-
-        # convert to lists, which is required by nx
-        color_list = []
-        size_list = []
-        for node in G:
-            color_list.append(colors[node])
-            size_list.append(sizes[node])
-        
-        area = [0,0]
-        for coord in self.pos.values():
-            for j in range(2):
-                area[j] = max(area[j],coord[j])
-        for j in range(2):
-            area[j] = (area[j] + 1 )*1.1
-            
-        if area[0]>2*area[1]:
-            ratio = 0.65
-        else:
-            ratio = 1
-
-        plt.figure(2,figsize=(2*area[0],2*ratio*area[1])) 
-        nx.draw(G, self.pos, node_color = color_list, node_size = size_list, labels = labels, with_labels = True,
-                font_color ='w', font_size = 18)
-        plt.show() 
\ No newline at end of file
+        _display().plot_layout(self,probs,labels,colors,sizes)
@@ -0,0 +1,94 @@
+# The rendering layer of universal, which draws devices with networkx and matplotlib. It is
+# imported by universal when first needed, so that the layout can be used without a display.
+
+import matplotlib.pyplot as plt
+import copy
+import networkx as nx
+
+def plot_layout(device,probs={},labels={},colors={},sizes={}):
+    """Creates and displays the image for `layout.plot`, which describes the kwargs."""
+    G=nx.Graph()
+    
+    for pair in device.links:
+        G.add_edge(device.links[pair][0],device.links[pair][1])
+        G.add_edge(device.links[pair][0],pair)
+        G.add_edge(device.links[pair][1],pair)
+    
+    if probs:
+        
+        label_changes = copy.deepcopy(labels)
+        color_changes = copy.deepcopy(colors)
+        size_changes = copy.deepcopy(sizes)
+        
+        labels = {}
+        colors = {}
+        sizes = {}
+        for node in G:
+            if probs[node]>1:
+                labels[node] = ""
+                colors[node] = 'grey'
+                sizes[node] = 3000
+            else:
+                labels[node] = "%.0f" % ( 100 * ( probs[node] ) )
+                colors[node] =( 1-probs[node],0,probs[node] )
+                if type(node)!=str:
+                    if labels[node]=='0':
+                        sizes[node] = 3000
+                    else:
+                        sizes[node] = 4000 
+                else:
+                    if labels[node]=='0':
+                        sizes[node] = 800
+                    else:
+                        sizes[node] = 1150
+                                     
+        for node in label_changes:
+            labels[node] = label_changes[node]
+        for node in color_changes:
+            colors[node] = color_changes[node]      
+        for node in size_changes:
+            sizes[node] = size_changes[node]                   
+                                    
+    else:
+        if not labels:
+            labels = {}
+            for node in G:
+                labels[node] = node
+        if not colors:
+            colors = {}
+            for node in G:
+                if type(node) is int:
+                    colors[node] = (node/device.num,0,1-node/device.num)
+                else:
+                    colors[node] = (0,0,0)
+        if not sizes:
+            sizes = {}
+            for node in G:
+                if type(node)!=str:
+                    sizes[node] = 3000
+                else:
+                    sizes[node] = 750
+
+    # convert to lists, which is required by nx
+    color_list = []
+    size_list = []
+    for node in G:
+        color_list.append(colors[node])
+        size_list.append(sizes[node])
+    
+    area = [0,0]
+    for coord in device.pos.values():
+        for j in range(2):
+            area[j] = max(area[j],coord[j])
+    for j in range(2):
+        area[j] = (area[j] + 1 )*1.1
+        
+    if area[0]>2*area[1]:
+        ratio = 0.65
+    else:
+        ratio = 1
+
+    plt.figure(2,figsize=(2*area[0],2*ratio*area[1])) 
+    nx.draw(G, device.pos, node_color = color_list, node_size = size_list, labels = labels, with_labels = True,
+            font_color ='w', font_size = 18)
+    plt.show()
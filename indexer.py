@@ -1,36 +1,894 @@
 # run this to scrape the notebooks for keywords and create and index
+#
+# Each notebook is parsed once, and its cells are fed to all the registered
+# extractors (see EXTRACTORS), which collect its keywords, the qiskit modules
+# it imports, the notebooks it runs with %run, the size of its outputs and
+# whether it has a version cell. The results are kept, along with the path,
+# mtime, size and content hash of every notebook, in a small manifest
+# (.index_manifest.json) that other scripts can use as a shared cache. With
+# --incremental, only notebooks whose contents have changed since the
+# manifest was written are parsed again, and index.md is rebuilt from the
+# merged manifest.
+#
+# Notebooks are not loaded as a whole. They are read in chunks, and only the
+# type and source of each cell are decoded: outputs (which hold the embedded
+# images) are skipped without being decoded or kept in memory.
+#
+# Use --jobs to parse notebooks in several processes at once. The index is
+# the same whatever the number of jobs.
+#
+# The index is also stored in a SQLite database (.index.sqlite), which can be
+# queried without scanning the tree again:
+#
+#     python indexer.py --lookup cx
+#     python indexer.py --lookup entangle --prefix --type Topics
+#     python indexer.py --notebook games/quantum_awesomeness.ipynb
+#
+# The same walk also fills a full-text index (SQLite FTS5) of the markdown and
+# code cells of every notebook, ranked by BM25. It is updated in place, with
+# only the notebooks whose contents changed being replaced:
+#
+#     python indexer.py --search "bell state measurement"
+#
+# If the SQLite of this Python was built without FTS5, the database is not
+# written, but index.md and the manifest still are.
+#
+# With --watch, the indexer keeps running and updates the index whenever
+# notebooks are saved, using inotify where available and polling otherwise.
 
 import os
+import re
+import posixpath
+import ast
 import json
+import codecs
+import hashlib
+import sqlite3
+import time
+import ctypes
+import ctypes.util
+import select
+import struct
+import argparse
+import multiprocessing
 
-index = {'Topics':{},'Commands':{}}
-for path, dirs, files in os.walk(os.getcwd()):
-    for file in files:
-        if file[-6:]=='.ipynb':
-            with open(path+'/'+file) as json_file:  
-                data = str(json.load(json_file))
-                start = data.find('keywords = ')
-                if (file!='indexer.ipynb') and('checkpoint' not in file) and start!=-1:
-                    data = data[(start+11):]
-                    end = data.find("}")
-                    data = data[:(end+1)]
-                    keywords = eval(data)
-                    rpath = (path+'/'+file).split('qiskit-tutorials/')[1]
-                    for kw_type in index:
-                        for topic in keywords[kw_type]:
-                            try:
-                                index[kw_type][topic].append(rpath)
-                            except:
-                                index[kw_type][topic] = [rpath]
-                                
-md = 'The following lists show notebooks in the Qiskit tutorials that are relevant for various keywords. Note that these lists only include notebooks for which these keywords have been added.\n\n'                          
-for kw_type in ['Commands','Topics']:
-    md += '\n## Index by '+kw_type+'\n\n'
-    for kw in sorted(index[kw_type]):
-        entry = '### ' + kw
-        for rpath in sorted(index[kw_type][kw]):
-            entry += '\n* [' + rpath.split('/')[-1].split('.')[0].replace('_',' ') + '](' + rpath + ')'
-        md += entry+'\n\n'
-
-with open('index.md','w') as file:
-    file.write(md)
+MANIFEST = '.index_manifest.json'
+MANIFEST_VERSION = 2
+DB = '.index.sqlite'
+KW_TYPES = ['Topics','Commands']
+
+def find_notebooks(root):
+    # Yields the full path of every notebook under root that should be indexed.
+
+    for path, dirs, files in os.walk(root):
+        dirs.sort()
+        for file in sorted(files):
+            if file[-6:]=='.ipynb' and (file!='indexer.ipynb') and ('checkpoint' not in file):
+                yield os.path.join(path,file)
+
+CHUNK_SIZE = 1 << 16
+
+class JsonStream():
+    # Reads a JSON document from a binary file in chunks. Values can either be decoded, or skipped without keeping them in memory.
+
+    decoder = json.JSONDecoder()
+    structural = re.compile(r'["\[\]{}]')
+    scalar = re.compile(r'[^,:\]}\s]+')
+
+    def __init__(self,file):
+        self.file = file
+        self.utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self,size=CHUNK_SIZE):
+        # Drops the consumed part of the buffer and appends at least `size` bytes more of the file.
+        
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        chunk = self.file.read(max(size,CHUNK_SIZE))
+        self.buf += self.utf8.decode(chunk, final=not chunk)
+        self.eof = not chunk
+
+    def peek(self):
+        # Returns the next character that is not whitespace, without consuming it.
+
+        while True:
+            while self.pos<len(self.buf) and self.buf[self.pos] in ' \t\n\r':
+                self.pos += 1
+            if self.pos<len(self.buf):
+                return self.buf[self.pos]
+            if self.eof:
+                raise ValueError('Unexpected end of notebook')
+            self.fill()
+
+    def expect(self,chars):
+        # Consumes the next character, which must be one of `chars`, and returns it.
+
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected one of '+repr(chars)+' but found '+repr(char))
+        self.pos += 1
+        return char
+
+    def read(self):
+        # Decodes the next value. This keeps the whole value in memory, so is only used for small ones.
+
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf,self.pos)
+                # a number at the end of the buffer might continue in the next chunk
+                if end<len(self.buf) or self.eof:
+                    self.pos = end
+                    return value
+            except ValueError:
+                if self.eof:
+                    raise
+            self.fill(2*len(self.buf))
+
+    def skip_string(self):
+        # Skips a string (starting at its opening quote), returning its encoded length.
+        # str.find is used rather than a regex, since it is much faster on long base64 strings.
+
+        start = self.pos
+        length = 0
+        self.pos += 1
+        quote = -1
+        while True:
+            if quote<self.pos:
+                quote = self.buf.find('"',self.pos)
+            end = len(self.buf) if quote==-1 else quote
+            escape = self.buf.find('\\',self.pos,end)
+            if escape==-1 and quote!=-1:
+                self.pos = quote+1
+                return length+self.pos-start
+            if escape!=-1 and (escape+1<len(self.buf) or self.eof):
+                self.pos = escape+2
+                continue
+            if self.eof:
+                raise ValueError('Unterminated string in notebook')
+            # the rest of the string, or the escaped character, has not been read yet
+            self.pos = end if escape==-1 else escape
+            length += self.pos-start
+            self.fill()
+            start = 0
+            quote = -1
+
+    def skip(self):
+        # Skips the next value, returning its encoded length.
+
+        char = self.peek()
+        if char=='"':
+            return self.skip_string()
+        if char not in '[{':
+            while True:
+                match = self.scalar.match(self.buf,self.pos)
+                if match.end()<len(self.buf) or self.eof:
+                    self.pos = match.end()
+                    return match.end()-match.start()
+                self.fill()
+        length = 0
+        depth = 0
+        while True:
+            match = self.structural.search(self.buf,self.pos)
+            if match is None:
+                length += len(self.buf)-self.pos
+                self.pos = len(self.buf)
+                if self.eof:
+                    raise ValueError('Unexpected end of notebook')
+                self.fill()
+                continue
+            length += match.start()-self.pos
+            self.pos = match.start()
+            char = match.group()
+            if char=='"':
+                length += self.skip_string()
+                continue
+            self.pos += 1
+            length += 1
+            depth += 1 if char in '[{' else -1
+            if depth==0:
+                return length
+
+    def members(self):
+        # Iterates over the keys of the next object. For each key, the caller must read or skip the value.
+
+        self.expect('{')
+        if self.peek()=='}':
+            self.pos += 1
+            return
+        while True:
+            key = self.read()
+            self.expect(':')
+            yield key
+            if self.expect(',}')=='}':
+                return
+
+    def items(self):
+        # Iterates over the next array. For each item, the caller must read or skip it.
+
+        self.expect('[')
+        if self.peek()==']':
+            self.pos += 1
+            return
+        while True:
+            yield
+            if self.expect(',]')==']':
+                return
+
+def iter_cells(file):
+    # Yields the type, source and encoded size of the outputs of each cell of the notebook in the given binary file.
+    # Everything else is skipped.
+
+    stream = JsonStream(file)
+    for key in stream.members():
+        if key!='cells':
+            stream.skip()
+            continue
+        for _ in stream.items():
+            cell = {}
+            output_size = 0
+            for field in stream.members():
+                if field in ['cell_type','source']:
+                    cell[field] = stream.read()
+                elif field=='outputs':
+                    output_size = stream.skip()
+                else:
+                    stream.skip()
+            source = cell.get('source','')
+            if isinstance(source,list):
+                source = ''.join(source)
+            yield cell.get('cell_type'), source, output_size
+        return
+
+def parse_keywords(source):
+    # Returns the dictionary assigned by `keywords = {...}` in the given source, or None if there is none.
+    # Only literals are accepted, so nothing in the notebook is executed.
+
+    start = source.find('keywords = ')
+    if start==-1:
+        return None
+    start = source.find('{',start)
+    end = source.find('}',start)
+    while start!=-1 and end!=-1:
+        try:
+            keywords = ast.literal_eval(source[start:end+1])
+        except (ValueError, SyntaxError):
+            end = source.find('}',end+1)
+            continue
+        if isinstance(keywords,dict):
+            return keywords
+        return None
+    return None
+
+class Extractor():
+    # Collects one piece of metadata from the cells of a notebook. A new instance is made for each notebook, with the
+    # notebook's path relative to the root. Its result is stored in the notebook's manifest entry under `name`, so must
+    # be serializable as JSON.
+
+    name = None
+
+    def __init__(self,rpath):
+        self.rpath = rpath
+
+    def cell(self,cell_type,source,output_size):
+        # Called for each cell, in order.
+        pass
+
+    def result(self):
+        return None
+
+# the extractors run on every notebook that is parsed, in the order they were registered
+EXTRACTORS = []
+
+def register(extractor):
+    # Class decorator that adds an extractor to those run on every notebook.
+
+    EXTRACTORS.append(extractor)
+    return extractor
+
+@register
+class KeywordsExtractor(Extractor):
+    # The dictionary defined by `keywords = {...}` in the first code cell that has one, or None.
+
+    name = 'keywords'
+
+    def __init__(self,rpath):
+        super().__init__(rpath)
+        self.keywords = None
+
+    def cell(self,cell_type,source,output_size):
+        if self.keywords is None and cell_type=='code' and 'keywords = ' in source:
+            self.keywords = parse_keywords(source)
+
+    def result(self):
+        return self.keywords
+
+@register
+class QiskitImportsExtractor(Extractor):
+    # The sorted list of qiskit modules imported by the code cells.
+
+    name = 'qiskit_imports'
+    pattern = re.compile(r'^\s*(?:from\s+(qiskit[\w.]*)\s+import|import\s+(qiskit[\w.]*(?:\s*,\s*[\w.]+)*))', re.M)
+
+    def __init__(self,rpath):
+        super().__init__(rpath)
+        self.modules = set()
+
+    def cell(self,cell_type,source,output_size):
+        if cell_type=='code' and 'qiskit' in source:
+            for module, modules in self.pattern.findall(source):
+                if module:
+                    self.modules.add(module)
+                for module in modules.split(','):
+                    if module.strip().startswith('qiskit'):
+                        self.modules.add(module.strip())
+
+    def result(self):
+        return sorted(self.modules)
+
+@register
+class RunExtractor(Extractor):
+    # The notebooks run with `%run` by the code cells, as paths relative to the root, in the order they are run.
+
+    name = 'run'
+    pattern = re.compile(r'^\s*%run\s+(?:"([^"]+)"|\'([^\']+)\'|(\S+))', re.M)
+
+    def __init__(self,rpath):
+        super().__init__(rpath)
+        self.notebooks = []
+
+    def cell(self,cell_type,source,output_size):
+        if cell_type=='code' and '%run' in source:
+            for match in self.pattern.findall(source):
+                target = ''.join(match)
+                if target.endswith('.ipynb'):
+                    target = posixpath.normpath(posixpath.join(posixpath.dirname(self.rpath),target))
+                    if target not in self.notebooks:
+                        self.notebooks.append(target)
+
+    def result(self):
+        return self.notebooks
+
+@register
+class OutputSizeExtractor(Extractor):
+    # The total encoded size of the outputs of all cells, in bytes.
+
+    name = 'output_size'
+
+    def __init__(self,rpath):
+        super().__init__(rpath)
+        self.size = 0
+
+    def cell(self,cell_type,source,output_size):
+        self.size += output_size
+
+    def result(self):
+        return self.size
+
+@register
+class VersionCellExtractor(Extractor):
+    # Whether a code cell runs a version.ipynb notebook, to display the versions of the packages used.
+
+    name = 'version_cell'
+
+    def __init__(self,rpath):
+        super().__init__(rpath)
+        self.found = False
+
+    def cell(self,cell_type,source,output_size):
+        if not self.found and cell_type=='code' and 'version.ipynb' in source:
+            self.found = any(posixpath.basename(''.join(match))=='version.ipynb' for match in RunExtractor.pattern.findall(source))
+
+    def result(self):
+        return self.found
+
+def read_notebook(file, rpath=''):
+    # Returns the results of all extractors for the notebook in the given binary file, and the notebook's text.
+    # The text is a dictionary with the joined sources of the markdown cells and of the code cells.
+
+    extractors = [extractor(rpath) for extractor in EXTRACTORS]
+    text = {'markdown':[], 'code':[]}
+    for cell_type, source, output_size in iter_cells(file):
+        if cell_type in text:
+            text[cell_type].append(source)
+        for extractor in extractors:
+            extractor.cell(cell_type,source,output_size)
+    metadata = {extractor.name:extractor.result() for extractor in extractors}
+    return metadata, {cell_type:'\n'.join(text[cell_type]) for cell_type in text}
+
+def file_hash(filename):
+    # Returns the sha1 of the file's contents, reading it in chunks.
+
+    sha1 = hashlib.sha1()
+    with open(filename,'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def scan_notebook(filename, rpath, entry=None):
+    # Returns the manifest entry for a notebook whose mtime or size differ from those in `entry`, along with its text.
+    # The notebook is only parsed if its content hash differs too, otherwise the text returned is None.
+
+    stat = os.stat(filename)
+    sha1 = file_hash(filename)
+    if entry and entry['sha1']==sha1:
+        metadata = {extractor.name:entry[extractor.name] for extractor in EXTRACTORS}
+        text = None
+    else:
+        with open(filename,'rb') as json_file:
+            metadata, text = read_notebook(json_file,rpath)
+    return dict(metadata, mtime=stat.st_mtime, size=stat.st_size, sha1=sha1), text
+
+def _scan_notebook(args):
+    # Unpacks the arguments of scan_notebook, for use with Pool.imap.
+    # Returns the exception instead if the notebook could not be read, such as one that is only half saved.
+
+    try:
+        return scan_notebook(*args)
+    except (OSError, ValueError) as e:
+        return e
+
+def scan(root, manifest=None, jobs=1, skip_errors=False):
+    # Returns a dictionary with an entry for each notebook under root, holding its mtime, size, content hash and the
+    # results of the extractors, and a dictionary with the text of each notebook that was parsed.
+    # Entries of the given manifest are reused for notebooks whose contents have not changed since it was written.
+    # With jobs>1, changed notebooks are parsed by a pool of that many worker processes. Results are merged in the
+    # order the notebooks were found, so the output does not depend on the number of jobs.
+    # With skip_errors, a notebook that cannot be read is reported and keeps its entry from the manifest (so that it is
+    # read again next time), or is left out if it has none. Otherwise the error is raised.
+
+    old = manifest or {}
+    entries = {}
+    texts = {}
+    changed = []
+    for filename in find_notebooks(root):
+        rpath = os.path.relpath(filename,root).replace(os.sep,'/')
+        stat = os.stat(filename)
+        entry = old.get(rpath)
+        if entry and entry['mtime']==stat.st_mtime and entry['size']==stat.st_size and all(extractor.name in entry for extractor in EXTRACTORS):
+            entries[rpath] = entry
+        else:
+            entries[rpath] = None
+            changed.append((rpath,filename,entry))
+
+    tasks = [(filename,rpath,entry) for rpath, filename, entry in changed]
+    if jobs>1 and len(tasks)>1:
+        with multiprocessing.Pool(min(jobs,len(tasks))) as pool:
+            results = list(pool.imap(_scan_notebook, tasks, chunksize=max(1,len(tasks)//(4*jobs))))
+    else:
+        results = [_scan_notebook(task) for task in tasks]
+    for (rpath, filename, entry), result in zip(changed,results):
+        if not isinstance(result,Exception):
+            entries[rpath], texts[rpath] = result
+        elif not skip_errors:
+            raise result
+        else:
+            print('Could not read %s: %s' % (rpath,result))
+            if entry:
+                entries[rpath] = entry
+            else:
+                del entries[rpath]
+    return entries, {rpath:text for rpath, text in texts.items() if text is not None}
+
+def build_index(entries):
+    # Collects the notebooks for each topic and command from the entries of a scan.
+
+    index = {kw_type:{} for kw_type in KW_TYPES}
+    for rpath in entries:
+        keywords = entries[rpath]['keywords']
+        if keywords:
+            for kw_type in index:
+                for topic in keywords.get(kw_type,[]):
+                    index[kw_type].setdefault(topic,[]).append(rpath)
+    return index
+
+def notebook_title(rpath):
+    # The name under which a notebook is listed in the index.
+
+    return rpath.split('/')[-1].split('.')[0].replace('_',' ')
+
+def render_markdown(index):
+
+    md = 'The following lists show notebooks in the Qiskit tutorials that are relevant for various keywords. Note that these lists only include notebooks for which these keywords have been added.\n\n'
+    for kw_type in ['Commands','Topics']:
+        md += '\n## Index by '+kw_type+'\n\n'
+        for kw in sorted(index[kw_type]):
+            entry = '### ' + kw
+            for rpath in sorted(index[kw_type][kw]):
+                entry += '\n* [' + notebook_title(rpath) + '](' + rpath + ')'
+            md += entry+'\n\n'
+    return md
+
+DB_VERSION = 2
+DB_SCHEMA = """
+CREATE TABLE notebooks (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    title TEXT NOT NULL,
+    sha1 TEXT NOT NULL
+);
+CREATE TABLE keywords (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    name TEXT NOT NULL,
+    term TEXT NOT NULL,
+    UNIQUE (kind, name)
+);
+CREATE INDEX keywords_by_term ON keywords (term, kind);
+CREATE TABLE notebook_keywords (
+    keyword_id INTEGER NOT NULL REFERENCES keywords (id),
+    notebook_id INTEGER NOT NULL REFERENCES notebooks (id),
+    PRIMARY KEY (keyword_id, notebook_id)
+) WITHOUT ROWID;
+CREATE INDEX notebook_keywords_by_notebook ON notebook_keywords (notebook_id, keyword_id);
+CREATE VIRTUAL TABLE notebook_text USING fts5 (title, markdown, code);
+"""
+# weights of the title, markdown and code columns in the BM25 score
+SEARCH_WEIGHTS = (4.0, 1.0, 1.0)
+
+def search_term(name):
+    # Keywords are looked up without case or the backticks used for commands.
+
+    return name.strip('`').lower()
+
+def open_db(filename):
+    # Opens the index database, creating it if it is missing or was written by an older version of the indexer.
+
+    if os.path.exists(filename):
+        db = sqlite3.connect(filename)
+        if db.execute('PRAGMA user_version').fetchone()[0]==DB_VERSION:
+            return db
+        db.close()
+        os.remove(filename)
+    db = sqlite3.connect(filename)
+    # readers, such as a search service, are not blocked while the index is updated
+    db.execute('PRAGMA journal_mode=WAL')
+    try:
+        with db:
+            db.executescript(DB_SCHEMA)
+            db.execute('PRAGMA user_version = %d' % DB_VERSION)
+    except sqlite3.OperationalError:
+        # such as when SQLite was built without FTS5: no half made database is left behind
+        db.close()
+        os.remove(filename)
+        raise
+    return db
+
+def write_db(filename, entries, index, texts, root):
+    # Brings the index database up to date, in a single transaction.
+    # Only notebooks whose hash differs from the stored one have their text replaced. Their text is taken from `texts`,
+    # or read from the notebook under root if it was not parsed in this run.
+
+    db = open_db(filename)
+    with db:
+        stored = {rpath:(notebook_id,sha1) for notebook_id, rpath, sha1 in db.execute('SELECT id, path, sha1 FROM notebooks')}
+        for rpath in stored:
+            if rpath not in entries:
+                db.execute('DELETE FROM notebook_text WHERE rowid = ?', (stored[rpath][0],))
+                db.execute('DELETE FROM notebooks WHERE id = ?', (stored[rpath][0],))
+        notebook_ids = {}
+        updated = False
+        for rpath in entries:
+            sha1 = entries[rpath]['sha1']
+            if rpath in stored:
+                notebook_ids[rpath] = stored[rpath][0]
+                if stored[rpath][1]==sha1:
+                    continue
+                db.execute('UPDATE notebooks SET sha1 = ? WHERE id = ?', (sha1,notebook_ids[rpath]))
+                db.execute('DELETE FROM notebook_text WHERE rowid = ?', (notebook_ids[rpath],))
+            else:
+                notebook_ids[rpath] = db.execute('INSERT INTO notebooks (path, title, sha1) VALUES (?, ?, ?)',
+                                                 (rpath, notebook_title(rpath), sha1)).lastrowid
+            text = texts.get(rpath)
+            if text is None:
+                with open(os.path.join(root,rpath),'rb') as json_file:
+                    text = read_notebook(json_file,rpath)[1]
+            db.execute('INSERT INTO notebook_text (rowid, title, markdown, code) VALUES (?, ?, ?, ?)',
+                       (notebook_ids[rpath], notebook_title(rpath), text['markdown'], text['code']))
+            updated = True
+        if updated:
+            # merge the segments written by the updates, which keeps the full-text index compact
+            db.execute("INSERT INTO notebook_text (notebook_text) VALUES ('optimize')")
+
+        # the keyword tables are small, so are simply rebuilt
+        db.execute('DELETE FROM notebook_keywords')
+        db.execute('DELETE FROM keywords')
+        for kw_type in KW_TYPES:
+            for kw in sorted(index[kw_type]):
+                keyword_id = db.execute('INSERT INTO keywords (kind, name, term) VALUES (?, ?, ?)',
+                                        (kw_type, kw, search_term(kw))).lastrowid
+                for rpath in sorted(set(index[kw_type][kw])):
+                    db.execute('INSERT INTO notebook_keywords (keyword_id, notebook_id) VALUES (?, ?)',
+                               (keyword_id, notebook_ids[rpath]))
+    db.close()
+
+def lookup(filename, term, kw_type=None, prefix=False):
+    # Returns (type, keyword, notebook path) for every notebook listed under the keywords matching `term`.
+    # With prefix=True, all keywords starting with `term` match.
+
+    term = search_term(term)
+    if prefix:
+        # a range on the indexed column, since LIKE would not use the index
+        where = 'k.term >= ? AND k.term < ?'
+        params = [term, term+'\U0010ffff']
+    else:
+        where = 'k.term = ?'
+        params = [term]
+    if kw_type:
+        where += ' AND k.kind = ?'
+        params.append(kw_type)
+    db = sqlite3.connect(filename)
+    try:
+        return db.execute('SELECT k.kind, k.name, n.path FROM keywords k '
+                          'JOIN notebook_keywords nk ON nk.keyword_id = k.id '
+                          'JOIN notebooks n ON n.id = nk.notebook_id '
+                          'WHERE '+where+' ORDER BY k.kind, k.name, n.path', params).fetchall()
+    finally:
+        db.close()
+
+def notebook_keywords(filename, rpath):
+    # Returns (type, keyword) for every keyword of the notebook with the given path.
+
+    db = sqlite3.connect(filename)
+    try:
+        return db.execute('SELECT k.kind, k.name FROM notebooks n '
+                          'JOIN notebook_keywords nk ON nk.notebook_id = n.id '
+                          'JOIN keywords k ON k.id = nk.keyword_id '
+                          'WHERE n.path = ? ORDER BY k.kind, k.name', (rpath,)).fetchall()
+    finally:
+        db.close()
+
+def search_query(text):
+    # Turns free text into an FTS5 query that matches notebooks containing all of its words.
+    # Words are quoted, so that punctuation in the text (such as in `qc.cx(q[0])`) is not read as query syntax.
+
+    return ' '.join('"'+word+'"' for word in re.findall(r'\w+',text))
+
+def search(filename, text, limit=10):
+    # Returns (path, score, snippet) for the notebooks best matching `text`, ranked by BM25 (lower scores are better).
+
+    query = search_query(text)
+    if not query:
+        return []
+    db = sqlite3.connect(filename)
+    try:
+        return db.execute('SELECT n.path, bm25(notebook_text, ?, ?, ?) AS score, '
+                          "snippet(notebook_text, -1, '[', ']', '...', 12) FROM notebook_text "
+                          'JOIN notebooks n ON n.id = notebook_text.rowid '
+                          'WHERE notebook_text MATCH ? ORDER BY score LIMIT ?',
+                          SEARCH_WEIGHTS+(query,limit)).fetchall()
+    finally:
+        db.close()
+
+def load_manifest(filename):
+    # Returns the notebook entries stored in the manifest, or an empty dictionary if it is missing or out of date.
+
+    try:
+        with open(filename) as file:
+            manifest = json.load(file)
+    except (IOError, ValueError):
+        return {}
+    if manifest.get('version')!=MANIFEST_VERSION:
+        return {}
+    return manifest['notebooks']
+
+def write_atomic(filename, text):
+    # Writes to a temporary file first, so that readers never see a half written file.
+
+    tmp = filename + '.tmp'
+    with open(tmp,'w',encoding='utf-8') as file:
+        file.write(text)
+    os.replace(tmp,filename)
+
+def update_index(root, old=None, jobs=1, skip_errors=False):
+    # Scans the notebooks under root, reusing the given manifest entries, and rewrites index.md, the manifest and the
+    # database. Returns the new entries and the number of notebooks that were parsed.
+    # index.md is written first, and does not depend on the database, which cannot be written by a Python whose SQLite
+    # lacks FTS5.
+
+    entries, texts = scan(root, old, jobs, skip_errors)
+    index = build_index(entries)
+    write_atomic(os.path.join(root,'index.md'), render_markdown(index))
+    write_atomic(os.path.join(root,MANIFEST), json.dumps({'version':MANIFEST_VERSION,'notebooks':entries}, indent=1, sort_keys=True))
+    try:
+        write_db(os.path.join(root,DB), entries, index, texts, root)
+    except sqlite3.OperationalError as e:
+        print('Could not update %s (%s), so --lookup, --notebook and --search will not see these changes' % (DB,e))
+    return entries, len(texts)
+
+# directories that are never watched for changes
+IGNORED_DIRS = ['.git', '.ipynb_checkpoints']
+
+class InotifyWatcher():
+    # Waits for notebooks under a directory to change, using the inotify API of Linux.
+
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self,root):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.libc.inotify_init1.argtypes = [ctypes.c_int]
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd<0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.dirs = {}
+        self.add_tree(root)
+
+    def add_tree(self,top):
+        # Watches a directory and all directories below it.
+
+        for path, dirs, files in os.walk(top):
+            dirs[:] = [d for d in dirs if d not in IGNORED_DIRS]
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.MASK)
+            if wd<0:
+                raise OSError(ctypes.get_errno(), 'inotify_add_watch failed for '+path)
+            self.dirs[wd] = path
+
+    def changes(self,timeout):
+        # Returns whether a notebook changed in the events read within `timeout` seconds (None waits forever).
+
+        if not select.select([self.fd],[],[],timeout)[0]:
+            return False
+        data = os.read(self.fd, 1 << 16)
+        changed = False
+        pos = 0
+        while pos<len(data):
+            wd, mask, cookie, length = self.EVENT.unpack_from(data,pos)
+            name = os.fsdecode(data[pos+self.EVENT.size:pos+self.EVENT.size+length].rstrip(b'\0'))
+            pos += self.EVENT.size+length
+            if mask & self.IN_Q_OVERFLOW:
+                changed = True
+            elif mask & self.IN_IGNORED:
+                self.dirs.pop(wd,None)
+            elif mask & self.IN_ISDIR:
+                if mask & (self.IN_CREATE|self.IN_MOVED_TO) and name not in IGNORED_DIRS and wd in self.dirs:
+                    self.add_tree(os.path.join(self.dirs[wd],name))
+                    changed = True
+                elif mask & (self.IN_DELETE|self.IN_MOVED_FROM):
+                    changed = True
+            elif name.endswith('.ipynb') and not (mask & self.IN_CREATE):
+                # a new file is only of interest once it has been written
+                changed = True
+        return changed
+
+    def wait(self,debounce):
+        # Blocks until a notebook changes, and then until no further changes are seen for `debounce` seconds.
+
+        while not self.changes(None):
+            pass
+        while self.changes(debounce):
+            pass
+
+class PollingWatcher():
+    # Waits for notebooks under a directory to change, by comparing their mtimes and sizes every `interval` seconds.
+
+    def __init__(self,root,interval=1.0):
+        self.root = root
+        self.interval = interval
+        self.last = self.snapshot()
+
+    def snapshot(self):
+        state = {}
+        for filename in find_notebooks(self.root):
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            state[filename] = (stat.st_mtime,stat.st_size)
+        return state
+
+    def wait(self,debounce):
+        # Blocks until a notebook changes, and then until no further changes are seen for `debounce` seconds.
+
+        current = self.last
+        while current==self.last:
+            time.sleep(self.interval)
+            current = self.snapshot()
+        self.last = current
+        while True:
+            time.sleep(debounce)
+            current = self.snapshot()
+            if current==self.last:
+                return
+            self.last = current
+
+def watch(root, jobs=1, debounce=0.5, interval=1.0, polling=False):
+    # Keeps index.md up to date until interrupted, updating it whenever notebooks change.
+    # Each update only parses the notebooks that changed, and index.md is replaced atomically.
+
+    entries, parsed = update_index(root, load_manifest(os.path.join(root,MANIFEST)), jobs, skip_errors=True)
+    watcher = None
+    if not polling:
+        try:
+            watcher = InotifyWatcher(root)
+        except (OSError, AttributeError) as e:
+            print('inotify is not available (%s), polling for changes instead' % e)
+    if watcher is None:
+        watcher = PollingWatcher(root,interval)
+    print('Watching %s for changes to %d notebooks ...' % (root,len(entries)))
+    try:
+        while True:
+            watcher.wait(debounce)
+            # notebooks that cannot be read, such as ones being saved, keep their previous entries until they can
+            try:
+                entries, parsed = update_index(root, entries, jobs, skip_errors=True)
+            except Exception as e:
+                print('%s: could not update index.md (%s: %s)' % (time.strftime('%H:%M:%S'),type(e).__name__,e))
+                continue
+            print('%s: updated index.md (%d notebooks parsed)' % (time.strftime('%H:%M:%S'),parsed))
+    except KeyboardInterrupt:
+        pass
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape the notebooks for keywords and create index.md.')
+    parser.add_argument('--incremental', action='store_true',
+                        help='only parse notebooks that changed since the last run, using '+MANIFEST)
+    parser.add_argument('--root', default=os.getcwd(),
+                        help='directory to scan and write index.md to (default: current directory)')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of worker processes used to parse notebooks (0 for one per core, default: 1)')
+    parser.add_argument('--lookup', metavar='KEYWORD',
+                        help='list the notebooks for a topic or command from '+DB+', without scanning')
+    parser.add_argument('--prefix', action='store_true',
+                        help='with --lookup, match all keywords starting with KEYWORD')
+    parser.add_argument('--type', choices=KW_TYPES,
+                        help='with --lookup, only match keywords of this type')
+    parser.add_argument('--notebook', metavar='PATH',
+                        help='list the keywords of a notebook from '+DB+', without scanning')
+    parser.add_argument('--search', metavar='TEXT',
+                        help='full-text search of the markdown and code of all notebooks in '+DB+', without scanning')
+    parser.add_argument('--limit', type=int, default=10,
+                        help='with --search, the maximum number of results (default: 10)')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running, and update the index incrementally whenever notebooks change')
+    parser.add_argument('--debounce', type=float, default=0.5,
+                        help='with --watch, seconds without further changes to wait before updating (default: 0.5)')
+    parser.add_argument('--poll', action='store_true',
+                        help='with --watch, poll for changes instead of using inotify')
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help='with --watch --poll, seconds between checks for changes (default: 1.0)')
+    args = parser.parse_args()
+
+    root = os.path.abspath(args.root)
+    db = os.path.join(root,DB)
+    if args.lookup is not None or args.notebook is not None or args.search is not None:
+        if not os.path.exists(db):
+            parser.error(db+' does not exist, run the indexer first')
+        if args.lookup is not None:
+            heading = None
+            for kw_type, kw, rpath in lookup(db, args.lookup, args.type, args.prefix):
+                if (kw_type,kw)!=heading:
+                    heading = (kw_type,kw)
+                    print(kw_type+': '+kw)
+                print('  '+rpath)
+        if args.notebook is not None:
+            for kw_type, kw in notebook_keywords(db, args.notebook.replace(os.sep,'/')):
+                print(kw_type+': '+kw)
+        if args.search is not None:
+            for rpath, score, snippet in search(db, args.search, args.limit):
+                print('%7.2f  %s' % (-score, rpath))
+                print('         '+' '.join(snippet.split()))
+        return
+
+    jobs = args.jobs or os.cpu_count()
+    if args.watch:
+        watch(root, jobs, args.debounce, args.interval, args.poll)
+    elif args.incremental:
+        update_index(root, load_manifest(os.path.join(root,MANIFEST)), jobs)
+    else:
+        update_index(root, None, jobs)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+# The scripts under test are run from the repository, not installed, so they are imported from where they are.
+
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'games', 'game_engines'))
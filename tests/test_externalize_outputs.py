@@ -0,0 +1,41 @@
+import os
+import base64
+import random
+
+import externalize_outputs as eo
+
+def make_notebook(rng):
+    png = base64.b64encode(rng.randbytes(20000)).decode('ascii')
+    svg = ['<svg xmlns="http://www.w3.org/2000/svg">\n'] + ['<path d="M %d %d"/>\n' % (j, j) for j in range(1000)] + ['</svg>']
+    outputs = [{'output_type':'display_data', 'metadata':{'needs_background':'light'},
+                'data':{'image/png':png+'\n', 'text/plain':['<Figure size 432x288 with 1 Axes>']}},
+               {'output_type':'execute_result', 'execution_count':2, 'metadata':{},
+                'data':{'image/png':png, 'text/plain':['<Figure>']}},
+               {'output_type':'display_data', 'metadata':{}, 'data':{'image/svg+xml':svg, 'text/plain':['<SVG>']}},
+               {'output_type':'display_data', 'metadata':{}, 'data':{'image/png':'iVBORw0KGgo=\n', 'text/plain':['<Small>']}}]
+    cells = [{'cell_type':'markdown', 'metadata':{}, 'source':['# Images ✓']},
+             {'cell_type':'code', 'execution_count':2, 'metadata':{}, 'outputs':outputs, 'source':['plot()']}]
+    return {'cells':cells, 'metadata':{}, 'nbformat':4, 'nbformat_minor':2}
+
+def test_rehydrate_gives_back_identical_bytes(tmp_path):
+    blobs = str(tmp_path / 'blobs')
+    text = eo.dumps_notebook(make_notebook(random.Random(0)))
+    filename = str(tmp_path / 'images.ipynb')
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write(text)
+
+    notebook = eo.read_notebook(filename)
+    moved = eo.externalize(notebook, blobs)
+    externalized = eo.dumps_notebook(notebook)
+    assert moved>0 and len(externalized)<len(text)
+    # the same PNG is used twice, but only stored once, and the small one is left in the notebook
+    assert len([file for path, dirs, files in os.walk(blobs) for file in files])==2
+    assert 'iVBORw0KGgo=' in externalized
+
+    assert eo.dumps_notebook(eo.rehydrate(notebook, blobs))==text
+
+def test_dry_run_writes_no_blobs(tmp_path):
+    blobs = str(tmp_path / 'blobs')
+    notebook = make_notebook(random.Random(1))
+    assert eo.externalize(notebook, blobs, dry_run=True)>0
+    assert not os.path.exists(blobs)
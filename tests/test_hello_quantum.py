@@ -0,0 +1,45 @@
+import pytest
+
+import hello_quantum as hq
+
+def allowed(gates0={}, gates1={}, both={}):
+    return {'0':dict(gates0), '1':dict(gates1), 'both':dict(both)}
+
+def test_solve_finds_a_shortest_solution():
+    # |00> to the Bell state with ZZ=1 and XX=1 takes an h and a cx, whatever else is allowed
+    solution = hq.solve([], {'XX':1.0,'ZZ':1.0}, allowed({'h':0,'x':0,'z':0}, {'cx':0,'x':0}))
+    assert solution==[('h','0'),('cx','1')]
+
+def test_solve_uses_required_gates():
+    # an x alone would do, but h must be used twice first
+    solution = hq.solve([], {'ZI':-1.0}, allowed({'x':0,'h':2}))
+    assert len(solution)==3
+    assert sorted(solution)==[('h','0'),('h','0'),('x','0')]
+
+def test_solve_starts_from_initialize():
+    assert hq.solve([('x','0')], {'ZI':1.0}, allowed({'x':0}))==[('x','0')]
+    assert hq.solve([('x','0')], {'ZI':-1.0}, allowed({'x':0}))==[]
+
+def test_solve_returns_none_without_a_solution():
+    # z never changes ZI
+    assert hq.solve([], {'ZI':-1.0}, allowed({'z':0})) is None
+
+def test_solve_gives_up_after_max_states():
+    rotations = {'ry(pi/4)':0, 'ry(-pi/4)':0, 'rx(pi/4)':0, 'h':0}
+    with pytest.raises(ValueError):
+        hq.solve([], {'ZZ':-0.5,'XX':0.3}, allowed(rotations, rotations, {'cz':0}), max_states=1000)
+
+def test_validate_puzzles():
+    puzzles = [{'initialize':[], 'success_condition':{'ZI':-1.0}, 'allowed_gates':allowed({'x':0})},
+               {'initialize':[], 'success_condition':{'ZI':-1.0}, 'allowed_gates':allowed({'z':0})},
+               {'initialize':[('t','0')], 'success_condition':{'ZI':-1.0}, 'allowed_gates':allowed({'x':0})}]
+    solutions = hq.validate_puzzles(puzzles, max_moves=10)
+    assert solutions[0]==[('x','0')]
+    assert solutions[1] is None
+    assert isinstance(solutions[2], (ValueError,KeyError))
+
+def test_program_round_trip():
+    moves = [('h','0'), ('ry(-pi/4)','1'), ('cx','1'), ('cz','both'), ('swap','0')]
+    program = hq.compile_program(moves)
+    assert (hq.load_program(hq.program_bytes(program))==program).all()
+    assert (hq.parse_program(hq.program_text(program))==program).all()
@@ -0,0 +1,75 @@
+import os
+import json
+import sqlite3
+
+import pytest
+
+import indexer
+
+def has_fts5():
+    try:
+        sqlite3.connect(':memory:').execute('CREATE VIRTUAL TABLE text USING fts5 (body)')
+    except sqlite3.OperationalError:
+        return False
+    return True
+
+def write_notebook(filename, keywords=None, text='Some text'):
+    cells = [{'cell_type':'markdown', 'metadata':{}, 'source':['# '+os.path.basename(filename)+'\n', text]},
+             {'cell_type':'code', 'execution_count':1, 'metadata':{}, 'source':['from qiskit import QuantumCircuit\n'],
+              'outputs':[{'output_type':'display_data', 'metadata':{}, 'data':{'image/png':'iVBORw0KGgo=\n', 'text/plain':['<Figure>']}}]}]
+    if keywords is not None:
+        cells.append({'cell_type':'code', 'execution_count':None, 'metadata':{}, 'outputs':[], 'source':['keywords = '+repr(keywords)]})
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    with open(filename, 'w') as file:
+        json.dump({'cells':cells, 'metadata':{}, 'nbformat':4, 'nbformat_minor':2}, file, indent=1)
+
+def make_tree(root):
+    for n in range(12):
+        keywords = {'Topics':['Topic %d' % (n%3), 'Shared'], 'Commands':['`cx`'] if n%2 else ['`h`', '`measure`']}
+        write_notebook(os.path.join(root, 'chapter_%d' % (n//4), 'notebook_%d.ipynb' % n), keywords if n%5 else None)
+
+def read_index(root):
+    with open(os.path.join(root, 'index.md')) as file:
+        return file.read()
+
+def test_jobs_give_the_same_index(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    indexer.update_index(root, None, 1)
+    serial = read_index(root)
+    assert '### Topic 1' in serial and '`cx`' in serial
+    indexer.update_index(root, None, 3)
+    assert read_index(root)==serial
+
+def test_incremental_gives_the_same_index(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    entries, parsed = indexer.update_index(root, None, 1)
+    assert parsed==12
+
+    # change one notebook, add one and remove one, making sure the mtime changes
+    changed = os.path.join(root, 'chapter_1', 'notebook_5.ipynb')
+    write_notebook(changed, {'Topics':['New topic'], 'Commands':[]})
+    stat = os.stat(changed)
+    os.utime(changed, (stat.st_atime, stat.st_mtime+1))
+    write_notebook(os.path.join(root, 'chapter_3', 'notebook_12.ipynb'), {'Topics':['Shared'], 'Commands':['`swap`']})
+    os.remove(os.path.join(root, 'chapter_0', 'notebook_1.ipynb'))
+
+    entries, parsed = indexer.update_index(root, indexer.load_manifest(os.path.join(root, indexer.MANIFEST)), 1)
+    assert parsed==2
+    incremental = read_index(root)
+    assert 'New topic' in incremental and 'notebook_1.ipynb' not in incremental
+
+    os.remove(os.path.join(root, indexer.MANIFEST))
+    indexer.update_index(root, None, 2)
+    assert read_index(root)==incremental
+
+@pytest.mark.skipif(not has_fts5(), reason='the SQLite of this Python has no FTS5')
+def test_lookup_and_search(tmp_path):
+    root = str(tmp_path)
+    make_tree(root)
+    write_notebook(os.path.join(root, 'bell.ipynb'), {'Topics':['Entanglement'], 'Commands':['`cx`']}, text='A Bell state measurement')
+    indexer.update_index(root, None, 1)
+    db = os.path.join(root, indexer.DB)
+    assert ('Topics', 'Entanglement', 'bell.ipynb') in indexer.lookup(db, 'entanglement')
+    assert [rpath for rpath, score, snippet in indexer.search(db, 'bell state')]==['bell.ipynb']